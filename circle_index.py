@@ -0,0 +1,403 @@
+'''Spatial index over enclosing circles for point and box queries'''
+
+# Standard modules
+import os
+import csv
+import sys
+import argparse
+import contextlib
+
+# Additional permitted modules
+import numpy as np
+
+
+class GridLevel:
+    '''
+    One uniform grid over circle bounding boxes.
+
+    The grid covers [origin, origin + shape * cell_size).  Circles are
+    listed in every cell their bounding box overlaps, in compressed sparse
+    row form: the circles in cell c are items[cell_start[c]:cell_start[c + 1]].
+    '''
+
+    def __init__(self, origin, cell_size, shape, items, cell_start):
+        self.origin = np.asarray(origin, dtype=np.float64)
+        self.cell_size = float(cell_size)
+        self.shape = np.asarray(shape, dtype=np.int64)
+        self.items = items
+        self.cell_start = cell_start
+
+    @classmethod
+    def build(cls, origin, cell_size, shape, circles, lo, hi):
+        '''
+        Grid listing circles by their bounding boxes.
+
+        :param origin: Grid lower corner
+        :param cell_size: Cell width
+        :param shape: Cells along x and y
+        :param circles: Circle indices
+        :param lo: (k, 2) array of bounding box lower corners
+        :param hi: (k, 2) array of bounding box upper corners
+        :return: GridLevel
+        '''
+
+        level = cls(origin, cell_size, shape, None, None)
+        owners, cells = level.cells(lo, hi)
+
+        order = np.argsort(cells, kind='stable')
+        level.items = np.asarray(circles, dtype=np.int64)[owners[order]]
+        counts = np.bincount(cells, minlength=int(np.prod(level.shape)))
+        level.cell_start = np.concatenate([[0], np.cumsum(counts)])
+
+        return level
+
+    def cell_ranges(self, lo, hi):
+        '''
+        Clipped grid cell index ranges of boxes.
+
+        :param lo: (m, 2) array of box lower corners
+        :param hi: (m, 2) array of box upper corners
+        :return: (m, 2) first and last cell arrays, inclusive, with last
+                 before first on an axis where the box misses the grid
+        '''
+
+        first = np.floor((lo - self.origin) / self.cell_size)
+        last = np.floor((hi - self.origin) / self.cell_size)
+        first = np.clip(first, 0, self.shape - 1).astype(np.int64)
+        outside = (hi < self.origin) | (lo > self.origin + self.shape * self.cell_size)
+        last = np.where(outside, first - 1, np.clip(last, 0, self.shape - 1)).astype(np.int64)
+
+        return first, last
+
+    def cells(self, lo, hi):
+        '''
+        Every cell overlapped by each box, without a Python loop.
+
+        :param lo: (m, 2) array of box lower corners
+        :param hi: (m, 2) array of box upper corners
+        :return: owners, cells arrays, one entry per (box, cell)
+        '''
+
+        first, last = self.cell_ranges(lo, hi)
+        spans = np.maximum(last - first + 1, 0)
+        counts = spans[:, 0] * spans[:, 1]
+
+        owners = np.repeat(np.arange(len(counts)), counts)
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        cell_x = first[owners, 0] + local % spans[owners, 0]
+        cell_y = first[owners, 1] + local // spans[owners, 0]
+
+        return owners, cell_y * self.shape[0] + cell_x
+
+    def candidates(self, lo, hi):
+        '''
+        Circles listed in the cells each box overlaps.
+
+        :param lo: (m, 2) array of box lower corners
+        :param hi: (m, 2) array of box upper corners
+        :return: query, circle index arrays of candidate pairs
+        '''
+
+        owners, cells = self.cells(lo, hi)
+        starts = self.cell_start[cells]
+        counts = self.cell_start[cells + 1] - starts
+        local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        return np.repeat(owners, counts), self.items[np.repeat(starts, counts) + local]
+
+
+class CircleIndex:
+    '''
+    Multi-level uniform grid index over circles.
+
+    Circles are held as an (n, 2) array of centers and an (n,) array of
+    radii.  The first grid level has cells about the size of a typical
+    circle.  A circle whose bounding box would overlap more than max_cells
+    cells goes to the next level, with cells coarsen times wider, so large
+    circles never flood the fine grid.
+
+    Queries are batched.  Each query only looks at the circles listed in
+    the cells it touches on each level, then filters them with an exact
+    vectorised test, so the cost per query is constant for evenly spread
+    circles.
+    '''
+
+    def __init__(self, ids, centers, radii, cell_size=None, max_cells=64, coarsen=8):
+        '''
+        :param ids: Circle ids
+        :param centers: (n, 2) array of circle centers
+        :param radii: (n,) array of circle radii
+        :param cell_size: First level cell width, default is the larger of
+                          the median diameter and the cell width giving
+                          about one cell per circle
+        :param max_cells: Circles overlapping more cells go up a level
+        :param coarsen: Cell width ratio between levels
+        '''
+
+        self.ids = np.asarray(ids, dtype=str)
+        self.centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        self.radii = np.asarray(radii, dtype=np.float64)
+        self.levels = []
+
+        lo = self.centers - self.radii[:, None]
+        hi = self.centers + self.radii[:, None]
+        origin, extent = lo.min(axis=0), hi.max(axis=0) - lo.min(axis=0)
+
+        if cell_size is None:
+            area = max(np.prod(extent), np.finfo(float).tiny)
+            cell_size = max(2 * np.median(self.radii), np.sqrt(area / len(self.radii)))
+
+        remaining = np.arange(len(self.radii))
+        cell_size = max(cell_size, np.finfo(float).tiny)
+
+        while len(remaining):
+            shape = np.maximum(np.ceil(extent / cell_size), 1).astype(np.int64)
+            level = GridLevel(origin, cell_size, shape, None, None)
+
+            # Circles overlapping too many cells wait for a coarser level,
+            # a single cell level takes everything.
+            first, last = level.cell_ranges(lo[remaining], hi[remaining])
+            num_cells = np.prod(last - first + 1, axis=1)
+            fits = (num_cells <= max_cells) | (np.prod(shape) == 1)
+
+            self.levels.append(GridLevel.build(origin, cell_size, shape, remaining[fits],
+                                               lo[remaining[fits]], hi[remaining[fits]]))
+            remaining = remaining[~fits]
+            cell_size *= coarsen
+
+    def __len__(self):
+        return len(self.radii)
+
+    def _candidates(self, lo, hi):
+        '''
+        Candidate (query, circle) pairs from every level.
+
+        :param lo: (m, 2) array of query box lower corners
+        :param hi: (m, 2) array of query box upper corners
+        :return: query, circle index arrays
+        '''
+
+        pairs = [level.candidates(lo, hi) for level in self.levels]
+
+        return (np.concatenate([queries for queries, _ in pairs]),
+                np.concatenate([circles for _, circles in pairs]))
+
+    def containing(self, points):
+        '''
+        Find circles containing each point.
+
+        :param points: (m, 2) array of query points
+        :return: query, circle index arrays of every point inside or on a
+                 circle, sorted by query then circle
+        '''
+
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        queries, circles = self._candidates(points, points)
+
+        dist = np.hypot(*(points[queries] - self.centers[circles]).T)
+        keep = dist <= self.radii[circles]
+
+        return self._sorted_pairs(queries[keep], circles[keep])
+
+    def intersecting(self, boxes):
+        '''
+        Find circles intersecting each axis-aligned box.
+
+        :param boxes: (m, 4) array of (xmin, ymin, xmax, ymax) boxes
+        :return: query, circle index arrays of every circle meeting a box,
+                 sorted by query then circle
+        '''
+
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        lo, hi = boxes[:, :2], boxes[:, 2:]
+        queries, circles = self._candidates(lo, hi)
+
+        # Circle meets box if the closest box point to its center is inside it.
+        closest = np.clip(self.centers[circles], lo[queries], hi[queries])
+        dist = np.hypot(*(closest - self.centers[circles]).T)
+        keep = dist <= self.radii[circles]
+
+        # A circle listed in several cells of one box is found once per cell.
+        return self._sorted_pairs(queries[keep], circles[keep], unique=True)
+
+    def _sorted_pairs(self, queries, circles, unique=False):
+        '''
+        Sort (query, circle) pairs, optionally dropping repeats.
+
+        :return: query, circle index arrays
+        '''
+
+        keys = queries * len(self) + circles
+        keys = np.unique(keys) if unique else np.sort(keys)
+
+        return keys // len(self), keys % len(self)
+
+    def save(self, filename):
+        '''
+        Write index to npz file, replacing any previous index atomically.
+
+        :param filename: npz file name
+        '''
+
+        arrays = {'ids': self.ids, 'centers': self.centers, 'radii': self.radii,
+                  'num_levels': len(self.levels)}
+        for k, level in enumerate(self.levels):
+            arrays.update({f'level{k}_origin': level.origin,
+                           f'level{k}_cell_size': level.cell_size,
+                           f'level{k}_shape': level.shape,
+                           f'level{k}_items': level.items,
+                           f'level{k}_cell_start': level.cell_start})
+
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''
+        Read index written by save.
+
+        :param filename: npz file name
+        :return: CircleIndex
+        '''
+
+        index = cls.__new__(cls)
+
+        with np.load(filename) as data:
+            index.ids = data['ids']
+            index.centers = data['centers']
+            index.radii = data['radii']
+            index.levels = [GridLevel(*(data[f'level{k}_{name}'] for name in
+                                        ['origin', 'cell_size', 'shape', 'items', 'cell_start']))
+                            for k in range(int(data['num_levels']))]
+
+        return index
+
+
+def read_circles(filename):
+    '''
+    Read id,center_x,center_y,radius CSV as written by polygon_inside_circle
+    batch mode.
+
+    :param filename: CSV file name, '-' for stdin
+    :return: ids list, (n, 2) centers array, (n,) radii array
+    '''
+
+    ids, rows = [], []
+
+    with (contextlib.nullcontext(sys.stdin) if filename == '-' else open(filename)) as fh:
+        reader = csv.reader(fh)
+        header = next(reader)
+        if header != ['id', 'center_x', 'center_y', 'radius']:
+            raise ValueError(f'Unexpected header in {filename}: {header}')
+
+        for row in reader:
+            ids.append(row[0])
+            rows.append(row[1:])
+
+    values = np.array(rows, dtype=np.float64).reshape(-1, 3)
+
+    return ids, values[:, :2], values[:, 2]
+
+
+def read_points(filename):
+    '''
+    Read query points, one "x,y" or "x y" per line.
+
+    :param filename: File name, '-' for stdin
+    :return: (m, 2) array of points
+    '''
+
+    with (contextlib.nullcontext(sys.stdin) if filename == '-' else open(filename)) as fh:
+        rows = [line.replace(',', ' ').split() for line in fh if line.strip()]
+
+    return np.array(rows, dtype=np.float64).reshape(-1, 2)
+
+
+def build_index(args):
+    '''
+    Build index from batch mode CSV and save it.
+
+    :param args: Argparse command line arguments
+    '''
+
+    ids, centers, radii = read_circles(args.input)
+    index = CircleIndex(ids, centers, radii, args.cell_size, args.max_cells)
+    index.save(args.index)
+
+    if args.verbose:
+        print(f'Indexed {len(index)} circles in {args.index}')
+        for level in index.levels:
+            print(f'  grid {level.shape.tolist()} of {level.cell_size:.6g} cells, '
+                  f'{len(level.items)} cell entries')
+
+
+def query_index(args):
+    '''
+    Print query,id CSV of circles containing points or meeting boxes.
+
+    :param args: Argparse command line arguments
+    '''
+
+    index = CircleIndex.load(args.index)
+
+    if args.box is not None:
+        queries, circles = index.intersecting(np.array([args.box]))
+    elif args.point is not None:
+        queries, circles = index.containing(np.array([args.point]))
+    else:
+        queries, circles = index.containing(read_points(args.points))
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(['query', 'id'])
+    writer.writerows(zip(queries.tolist(), index.ids[circles].tolist()))
+
+
+if __name__ == "__main__":
+    # Command line argument handling with argparse.
+    parser = argparse.ArgumentParser(
+            description='Spatial index over enclosing circles')
+
+    # Verbose option
+    parser.add_argument('-v',  '--verbose',
+            help='Print additional information - default=%(default)s',
+            default=False, action="store_true")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build',
+            help='Build index from polygon_inside_circle batch mode CSV')
+    build.add_argument('-in', '--input',
+            required=True,
+            help='id,center_x,center_y,radius CSV, - for stdin', type=str)
+    build.add_argument('-ix', '--index',
+            required=True,
+            help='File name for index output', type=str)
+    build.add_argument('-cs', '--cell_size',
+            help='Grid cell width, automatic if omitted - default=%(default)s',
+            default=None, type=float)
+    build.add_argument('-mc', '--max_cells',
+            help='Circles overlapping more cells go to a coarser grid - default=%(default)s',
+            default=64, type=int)
+
+    query = subparsers.add_parser('query',
+            help='Find circles containing points or meeting a box')
+    query.add_argument('-ix', '--index',
+            required=True,
+            help='File name for index input', type=str)
+    query_kind = query.add_mutually_exclusive_group(required=True)
+    query_kind.add_argument('-pt', '--point',
+            help='Query point', nargs=2, type=float, metavar=('X', 'Y'))
+    query_kind.add_argument('-pf', '--points',
+            help='Query points, one "x,y" or "x y" per line, - for stdin', type=str)
+    query_kind.add_argument('-bx', '--box',
+            help='Query box', nargs=4, type=float,
+            metavar=('XMIN', 'YMIN', 'XMAX', 'YMAX'))
+
+    # Parse argparse arguments.
+    cliargs = parser.parse_args()
+
+    if cliargs.command == 'build':
+        build_index(cliargs)
+    else:
+        query_index(cliargs)
@@ -5,107 +5,536 @@
 # https://www.goodreads.com/api
 # https://github.com/sefakilic/goodreads/blob/master/goodreads/book.py
 #
-# NEXT: add command line options for title/isbn
-#       add a verbose option
-#       clean up code
+# Usage:
+#   goodReads.py ISBN                         # one book
+#   goodReads.py -in isbns.txt -w 8 -rl 1     # batch, one ISBN per line
+#   goodReads.py -in - -ba http -u http://localhost:8000 < isbns.txt
+#   goodReads.py -ov "Deschooling Society" 150 2000  # pages, year override
+#   goodReads.py -ti "Deschooling Society"           # cached books only
+#
+# Fetched books are kept in an SQLite cache (--database) and only fetched
+# again after --ttl days, so repeated scoring runs stay off the network.
+#
+# The Goodreads API is retired, the http backend talks to anything serving
+# the same /book/isbn/<isbn>?format=xml responses, e.g. a local stub server.
+#
+# NEXT: clean up code
 #       finalise ratings measure to use:
 #         average_rating                                             Maybe
 #         average_rating/pages                                       Maybe
 #         average_rating*review_count/pages                          Nope
 #         average_rating*sqrt(review_count)/pages                    Maybe
 #         bayesian average taking into account the number of pages   Probably
-#         or a variant like this: http://stackoverflow.com/a/1411455 
+#         or a variant like this: http://stackoverflow.com/a/1411455
+
+from __future__ import print_function
 
+import os
 import sys
+import time
+import random
+import sqlite3
+import argparse
+import threading
+import xml.etree.ElementTree as ET
 from math import sqrt
 from datetime import date
-from goodreads import client
-
-gc = client.GoodreadsClient('<API Key>', '<API Secret>')
+from multiprocessing.pool import ThreadPool
 
 try:
-    book = gc.book(isbn=str(sys.argv[1]))
-except:
-    print >>sys.stderr, "Missing isbn\t", sys.argv[1]
-    exit()
+    import httplib as http_client
+    from urllib import urlencode
+    from urlparse import urlsplit
+except ImportError:
+    import http.client as http_client
+    from urllib.parse import urlencode, urlsplit
+
+PY2 = sys.version_info[0] == 2
+
+
+class BookNotFound(Exception):
+    '''Lookup failed for good, retrying will not help'''
+
+
+class Book(object):
+    '''Book metadata the ratings are calculated from
+
+    publication_date is (month, day, year) like the goodreads module,
+    missing parts are None.
+    '''
+
+    def __init__(self, title, average_rating, ratings_count, num_pages, publication_date):
+        self.title = title
+        self.average_rating = average_rating
+        self.ratings_count = ratings_count
+        self.num_pages = num_pages
+        self.publication_date = publication_date
+
+
+class ClientBackend(object):
+    '''Lookups through the goodreads module, one connection per request'''
+
+    def __init__(self, key, secret):
+        self.key = key
+        self.secret = secret
+        self.gc = None
+        self.lock = threading.Lock()
+
+    def client(self):
+        # Created on first lookup, so fully cached runs never import goodreads
+        with self.lock:
+            if self.gc is None:
+                from goodreads import client
+                self.gc = client.GoodreadsClient(self.key, self.secret)
+        return self.gc
+
+    def book(self, isbn):
+        try:
+            book = self.client().book(isbn=isbn)
+        except Exception as err:
+            # goodreads module raises the same exception for every failure
+            if 'not found' in str(err).lower():
+                raise BookNotFound(str(err))
+            raise
+
+        return Book(book.title, book.average_rating, book.ratings_count, book.num_pages,
+                    book.publication_date)
+
+
+class HttpBackend(object):
+    '''Lookups of /book/isbn/<isbn>?format=xml over keep-alive connections
+
+    Each worker thread keeps its own persistent connection to the server,
+    so a batch opens at most one connection per worker.
+    '''
+
+    def __init__(self, url, key, timeout=30):
+        parts = urlsplit(url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.path = parts.path.rstrip('/')
+        self.key = key
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            cls = http_client.HTTPSConnection if self.https else http_client.HTTPConnection
+            conn = self.local.conn = cls(self.host, timeout=self.timeout)
+        return conn
+
+    def close(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self.local.conn = None
+
+    def get(self, path):
+        conn = self.connection()
+        try:
+            conn.request('GET', path, headers={'Connection': 'keep-alive'})
+            resp = conn.getresponse()
+            body = resp.read()      # Read everything so the connection can be reused
+        except Exception:
+            # Server may have dropped an idle connection, reconnect on retry
+            self.close()
+            raise
+
+        if resp.getheader('connection', '').lower() == 'close':
+            self.close()
+
+        return resp.status, body
+
+    def book(self, isbn):
+        query = urlencode({'key': self.key, 'format': 'xml'})
+        status, body = self.get('%s/book/isbn/%s?%s' % (self.path, isbn, query))
+
+        if status == 404:
+            raise BookNotFound('HTTP 404')
+        if status != 200:
+            raise IOError('HTTP %d' % status)
+
+        book = ET.fromstring(body).find('book')
+        if book is None:
+            raise BookNotFound('No book in response')
+
+        def text(tag):
+            value = book.findtext(tag)
+            return value.strip() if value and value.strip() else None
+
+        return Book(text('title'), text('average_rating'), text('ratings_count'),
+                    text('num_pages'),
+                    (text('publication_month'), text('publication_day'),
+                     text('publication_year')))
+
+
+class RateLimiter(object):
+    '''Space calls at least 1/rate seconds apart across threads'''
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_time)
+            self.next_time = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def fetch_book(backend, isbn, limiter, retries, backoff):
+    '''Look up isbn, retrying failures with exponential backoff and jitter
+    Returns (isbn, book, None) or (isbn, None, error message).
+    '''
+
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            return isbn, backend.book(isbn), None
+        except BookNotFound as err:
+            return isbn, None, str(err)
+        except Exception as err:
+            if attempt == retries:
+                return isbn, None, str(err)
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+# Manual (title, num_pages, publication year) for books the API leaves
+# incomplete, None where the API value is fine.  Seeds the overrides table
+# of a new cache, edit the cache with --override afterwards.
+OVERRIDES = [
+    ("The Visual Display of Quantitative Information", 200, None),
+    ("The Elements of Statistical Learning: Data Mining, Inference, and Prediction", 552, 2001),
+    ("The New Media Reader [With CDROM]", 839, 2003),
+    ("Racing the Beam: The Atari Video Computer System", 180, 2009),
+    ("Nothing is True and Everything is Possible: Adventures in Modern Russia", 304, None),
+    ("Deschooling Society", 150, 2000),
+    ("An Introduction to Statistical Learning: with Applications in R (Springer Texts in Statistics)", 430, 2013),
+    ("Machines Who Think: A Personal Inquiry Into the History and Prospects of Artificial Intelligence", 576, None),
+    ("Terrible Beauty: A Cultural History of the Twentieth Century: The People and Ideas that Shaped the Modern Mind: A History", 847, 2000),
+    ("Code Complete, 2ed", 914, 1993),
+    ("The Way Things Work", None, 1988),
+]
+
+
+class BookCache(object):
+    '''SQLite store of fetched books and manual overrides
+
+    books holds the last record fetched for each ISBN with its fetch time,
+    indexed by title too.  overrides holds pages and year by title for
+    books the API gets wrong.  One connection is shared by the worker
+    threads behind a lock.
+    '''
+
+    SCHEMA = '''
+        CREATE TABLE IF NOT EXISTS books (
+            isbn             TEXT PRIMARY KEY,
+            title            TEXT,
+            average_rating   TEXT,
+            ratings_count    TEXT,
+            num_pages        TEXT,
+            publication_year TEXT,
+            fetched_at       REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS books_title ON books (title);
+        CREATE TABLE IF NOT EXISTS overrides (
+            title            TEXT PRIMARY KEY,
+            num_pages        INTEGER,
+            publication_year INTEGER,
+            updated_at       REAL NOT NULL);
+    '''
+
+    def __init__(self, filename, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+
+        with self.lock:
+            self.db.executescript(self.SCHEMA)
+
+            # Seed overrides once, so deleted overrides stay deleted
+            if self.db.execute('PRAGMA user_version').fetchone()[0] == 0:
+                now = time.time()
+                with self.db:
+                    self.db.executemany('INSERT OR IGNORE INTO overrides VALUES (?, ?, ?, ?)',
+                                        [row + (now,) for row in OVERRIDES])
+                    self.db.execute('PRAGMA user_version = 1')
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def _book(row):
+        title, average_rating, ratings_count, num_pages, pub_year = row
+        return Book(title, average_rating, ratings_count, num_pages, (None, None, pub_year))
+
+    def get(self, isbn):
+        '''Returns (book, fresh), book is None if isbn was never fetched'''
+
+        with self.lock:
+            row = self.db.execute('SELECT title, average_rating, ratings_count, num_pages, '
+                                  'publication_year, fetched_at FROM books WHERE isbn = ?',
+                                  (isbn,)).fetchone()
+        if row is None:
+            return None, False
+
+        return self._book(row[:-1]), time.time() - row[-1] < self.ttl
+
+    def put(self, isbn, book):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO books VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (isbn, book.title, book.average_rating, book.ratings_count,
+                             book.num_pages, book.publication_date[2], time.time()))
+
+    def by_title(self, title):
+        '''Returns [(isbn, book)] of cached books with exactly this title'''
 
+        with self.lock:
+            rows = self.db.execute('SELECT isbn, title, average_rating, ratings_count, num_pages, '
+                                   'publication_year FROM books WHERE title = ? ORDER BY isbn',
+                                   (title,)).fetchall()
 
-# weighted rating (WR) = (v / (v+m)) * R + (m / (v+m)) * C
-# where:
-#   * R = average for the movie (mean) = (Rating)
-#   * v = number of votes for the movie = (votes)
-#   * m = minimum votes required to be listed in the Top 250 (currently 1300)
-#   * C = the mean vote across the whole report (currently 6.8)
-m = 50  # What is dis fudge factor?
-C = 2.5 # What is dis fudge factor?
-v = int(book.ratings_count)
-R = float(book.average_rating)
-bayes = round(R*v/(v+m) + m*C/(v+m), 4)
-
-if book.num_pages == None:
-    print >>sys.stderr, book.num_pages, "\t", book.title, "\tMissing num_pages"
-    if book.title == "The Visual Display of Quantitative Information":
-        book.num_pages = 200
-    if book.title == "The Elements of Statistical Learning: Data Mining, Inference, and Prediction":
-        book.num_pages = 552
-    if book.title == "The New Media Reader [With CDROM]":
-        book.num_pages = 839
-    if book.title == "Racing the Beam: The Atari Video Computer System":
-        book.num_pages = 180
-    if book.title == "Nothing is True and Everything is Possible: Adventures in Modern Russia":
-        book.num_pages = 304
-    if book.title == "Deschooling Society":
-        book.num_pages = 150
-    if book.title == "An Introduction to Statistical Learning: with Applications in R (Springer Texts in Statistics)":
-        book.num_pages = 430
-    if book.title == "Machines Who Think: A Personal Inquiry Into the History and Prospects of Artificial Intelligence":
-        book.num_pages = 576
-    if book.title == "Terrible Beauty: A Cultural History of the Twentieth Century: The People and Ideas that Shaped the Modern Mind: A History":
-        book.num_pages = 847
-    if book.title == "Code Complete, 2ed":
-        book.num_pages = 914
-
-
-pub_year = book.publication_date[2]
-
-if pub_year == None:
-    print >>sys.stderr, pub_year, "\t", book.title, "\tMissing publication_date"
-    if book.title == "The Way Things Work":
-        pub_year = 1988
-    if book.title == "The Elements of Statistical Learning: Data Mining, Inference, and Prediction":
-        pub_year = 2001
-    if book.title == "The New Media Reader [With CDROM]":
-        pub_year = 2003
-    if book.title == "Racing the Beam: The Atari Video Computer System":
-        pub_year = 2009
-    if book.title == "Deschooling Society":
-        pub_year = 2000
-    if book.title == "An Introduction to Statistical Learning: with Applications in R (Springer Texts in Statistics)":
-        pub_year = 2013
-    if book.title == "Terrible Beauty: A Cultural History of the Twentieth Century: The People and Ideas that Shaped the Modern Mind: A History":
-        pub_year = 2000
-    if book.title == "Code Complete, 2ed":
-        pub_year = 1993
-
-pub_year = int(pub_year)
-now      = date.today().year
-years    = now - pub_year
-
-bayes_adj = round(bayes/int(book.num_pages), 4) # NOPE
-
-# Do want to read old books, so encourage that
-#bayes_adj = round(bayes*years/int(book.num_pages), 4) # Maybe?
-#bayes_adj = round(bayes*sqrt(years)/int(book.num_pages), 4) # Maybe?
-
-# Older books have had longer to acquire reviews, but only lightly penalise that
-#bayes_adj = round(bayes/int(book.num_pages*years), 4) # NOPE
-#bayes_adj = round(bayes/( int(book.num_pages)*sqrt(years) ), 4) # Maybe?
-#bayes_adj = round(bayes/sqrt( int(book.num_pages)*years ), 4)   # Maybe?
-#bayes_adj  = round(bayes/( int(book.num_pages)*sqrt(sqrt(years)) ), 4) # Maybe
-
-print book.average_rating, "\t", pub_year, "\t", years, "\t", book.ratings_count, "\t", book.num_pages, "\t", bayes, "\t", bayes_adj, "\t", book.title.encode('utf-8')
-
-exit()
+        return [(row[0], self._book(row[1:])) for row in rows]
+
+    def set_override(self, title, num_pages, pub_year):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO overrides VALUES (?, ?, ?, ?)',
+                            (title, num_pages, pub_year, time.time()))
+
+    def fill_missing(self, book):
+        '''Patch missing num_pages and publication year from overrides, return pub_year'''
+
+        pub_year = book.publication_date[2]
+        if book.num_pages != None and pub_year != None:
+            return pub_year
+
+        with self.lock:
+            row = self.db.execute('SELECT num_pages, publication_year FROM overrides '
+                                  'WHERE title = ?', (book.title,)).fetchone()
+        pages, year = row if row is not None else (None, None)
+
+        if book.num_pages == None:
+            print(book.num_pages, "\t", book.title, "\tMissing num_pages", file=sys.stderr)
+            book.num_pages = pages
+
+        if pub_year == None:
+            print(pub_year, "\t", book.title, "\tMissing publication_date", file=sys.stderr)
+            pub_year = year
+
+        return pub_year
+
+
+def score_book(book, cache):
+    '''Return output fields for book, None if pages or year are unknown'''
+
+    # weighted rating (WR) = (v / (v+m)) * R + (m / (v+m)) * C
+    # where:
+    #   * R = average for the movie (mean) = (Rating)
+    #   * v = number of votes for the movie = (votes)
+    #   * m = minimum votes required to be listed in the Top 250 (currently 1300)
+    #   * C = the mean vote across the whole report (currently 6.8)
+    m = 50  # What is dis fudge factor?
+    C = 2.5 # What is dis fudge factor?
+    v = int(book.ratings_count)
+    R = float(book.average_rating)
+    bayes = round(R*v/(v+m) + m*C/(v+m), 4)
+
+    pub_year = cache.fill_missing(book)
+    if book.num_pages == None or pub_year == None:
+        return None
+
+    pub_year = int(pub_year)
+    now      = date.today().year
+    years    = now - pub_year
+
+    bayes_adj = round(bayes/int(book.num_pages), 4) # NOPE
+
+    # Do want to read old books, so encourage that
+    #bayes_adj = round(bayes*years/int(book.num_pages), 4) # Maybe?
+    #bayes_adj = round(bayes*sqrt(years)/int(book.num_pages), 4) # Maybe?
+
+    # Older books have had longer to acquire reviews, but only lightly penalise that
+    #bayes_adj = round(bayes/int(book.num_pages*years), 4) # NOPE
+    #bayes_adj = round(bayes/( int(book.num_pages)*sqrt(years) ), 4) # Maybe?
+    #bayes_adj = round(bayes/sqrt( int(book.num_pages)*years ), 4)   # Maybe?
+    #bayes_adj  = round(bayes/( int(book.num_pages)*sqrt(sqrt(years)) ), 4) # Maybe
+
+    return [book.average_rating, pub_year, years, book.ratings_count, book.num_pages, bayes,
+            bayes_adj, book.title]
+
+
+def write_row(fields, out=sys.stdout):
+    line = u"\t".join(u"%s" % (field,) for field in fields) + u"\n"
+    out.write(line.encode('utf-8') if PY2 else line)
+    out.flush()
+
+
+def read_isbns(filename):
+    '''Yield ISBNs one per line from filename, - for stdin, skipping blanks and # comments'''
+
+    fh = sys.stdin if filename == '-' else open(filename)
+    try:
+        for line in fh:
+            isbn = line.split('#')[0].strip().replace('-', '')
+            if isbn:
+                yield isbn
+    finally:
+        if fh is not sys.stdin:
+            fh.close()
+
+
+def make_backend(argv):
+    if argv.backend == 'http':
+        return HttpBackend(argv.url, argv.key, argv.timeout)
+    return ClientBackend(argv.key, argv.secret)
+
+
+def cached_fetch(cache, backend, isbn, limiter, retries, backoff):
+    '''Look up isbn in cache, fetching and storing it if missing or stale
+    Returns (isbn, book, error), book is a stale copy when a refresh failed.
+    '''
+
+    cached, fresh = cache.get(isbn)
+    if fresh:
+        return isbn, cached, None
+
+    isbn, book, error = fetch_book(backend, isbn, limiter, retries, backoff)
+    if book is None:
+        return isbn, cached, error
+
+    cache.put(isbn, book)
+
+    return isbn, book, None
+
+
+def parse_override(value):
+    return None if value == '-' else int(value)
+
+
+def main(argv):
+    cache = BookCache(os.path.expanduser(argv.database), argv.ttl * 24 * 3600)
+
+    try:
+        if argv.override is not None:
+            title, pages, year = argv.override
+            cache.set_override(title, parse_override(pages), parse_override(year))
+            return
+
+        if argv.title is not None:
+            books = cache.by_title(argv.title)
+            if not books:
+                print("Missing title\t", argv.title, file=sys.stderr)
+            for isbn, book in books:
+                row = score_book(book, cache)
+                if row is not None:
+                    write_row([isbn] + row)
+            return
+
+        score_isbns(argv, cache)
+    finally:
+        cache.close()
+
+
+def score_isbns(argv, cache):
+    backend = make_backend(argv)
+    limiter = RateLimiter(argv.rate_limit)
+
+    if argv.isbn is not None:
+        isbns = [str(argv.isbn)]
+    else:
+        isbns = read_isbns(argv.input)
+
+    def lookup(isbn):
+        return cached_fetch(cache, backend, isbn, limiter, argv.retries, argv.backoff)
+
+    pool = ThreadPool(argv.workers)
+
+    try:
+        # Rows are written as lookups finish, not in input order
+        for isbn, book, error in pool.imap_unordered(lookup, isbns):
+            if book is None:
+                print("Missing isbn\t", isbn, "\t", error, file=sys.stderr)
+                continue
+            if error is not None:
+                print("Stale isbn\t", isbn, "\t", error, file=sys.stderr)
+
+            row = score_book(book, cache)
+            if row is None:
+                continue
+
+            write_row([isbn] + row if argv.isbn is None else row)
+    finally:
+        pool.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description='Lookup book ratings by ISBN and calculate further statistics')
+
+    parser.add_argument('isbn', nargs='?', default=None,
+            help='ISBN to look up, omit to read ISBNs from --input')
+
+    opts = parser.add_argument_group('optional arguments')
+    opts.add_argument('-in', '--input',
+            help='File of ISBNs one per line, - for stdin - default=%(default)s',
+            default='-', type=str)
+    opts.add_argument('-ba', '--backend',
+            help='Lookup backend - default=%(default)s',
+            default='client', type=str, choices=['client', 'http'])
+    opts.add_argument('-u',  '--url',
+            help='Base URL for http backend - default=%(default)s',
+            default='https://www.goodreads.com', type=str)
+    opts.add_argument('-k',  '--key',
+            help='API key, or GOODREADS_KEY environment variable - default=%(default)s',
+            default=os.environ.get('GOODREADS_KEY', '<API Key>'), type=str)
+    opts.add_argument('-se', '--secret',
+            help='API secret, or GOODREADS_SECRET environment variable - default=%(default)s',
+            default=os.environ.get('GOODREADS_SECRET', '<API Secret>'), type=str)
+    opts.add_argument('-db', '--database',
+            help='SQLite book cache, :memory: for none - default=%(default)s',
+            default='~/.goodreads.sqlite', type=str)
+    opts.add_argument('-tt', '--ttl',
+            help='Days before cached books are fetched again - default=%(default)s',
+            default=30.0, type=float)
+    opts.add_argument('-ti', '--title',
+            help='Score cached books with this title instead of looking up ISBNs - default=%(default)s',
+            default=None, type=str)
+    opts.add_argument('-ov', '--override',
+            help='Store pages and publication year for a title, - for none, and exit - default=%(default)s',
+            default=None, type=str, nargs=3, metavar=('TITLE', 'PAGES', 'YEAR'))
+    opts.add_argument('-w',  '--workers',
+            help='Concurrent lookups - default=%(default)s',
+            default=4, type=int)
+    opts.add_argument('-rl', '--rate_limit',
+            help='Maximum requests per second, 0 for unlimited - default=%(default)s',
+            default=1.0, type=float)
+    opts.add_argument('-rt', '--retries',
+            help='Retries per ISBN after a failed request - default=%(default)s',
+            default=3, type=int)
+    opts.add_argument('-bo', '--backoff',
+            help='First retry delay in seconds, doubled each retry - default=%(default)s',
+            default=1.0, type=float)
+    opts.add_argument('-to', '--timeout',
+            help='HTTP timeout in seconds - default=%(default)s',
+            default=30.0, type=float)
+
+    args = parser.parse_args()
+
+    if args.workers < 1 or args.rate_limit < 0 or args.retries < 0 or args.backoff < 0 or args.ttl < 0:
+        parser.error('--workers must be positive, --rate_limit, --retries, --backoff and --ttl non-negative')
+
+    if args.override is not None:
+        try:
+            list(map(parse_override, args.override[1:]))
+        except ValueError:
+            parser.error('--override PAGES and YEAR must be integers or -')
+
+    main(args)
+
+    exit()
 
 
 #print "Pages\t",   book.num_pages
@@ -116,4 +545,3 @@ exit()
 
 #authors = book.authors
 #print "Author\t", authors[0].name
-
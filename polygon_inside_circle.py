@@ -1,17 +1,29 @@
 '''Find the minimum enclosing circle for a polygon'''
 
 # Standard modules
+import re
 import sys
+import csv
+import json
 import math
-import random
+import time
 import argparse
+import itertools
+import contextlib
+import collections
+import multiprocessing
 
 # Additional permitted modules
-import cvxpy as cp
-from scipy.spatial import ConvexHull
+# cvxpy and scipy.spatial are imported where they are used, so --help,
+# argument errors and the Welzl and Ritter solvers start quickly.
+import numpy as np
 
 
-def get_convex_hull(vertices_set):
+# Outer ring of a WKT polygon, e.g. POLYGON ((0 0, 2 0, 2 2, 0 0))
+WKT_POLYGON = re.compile(r'^\s*POLYGON\s*\(\s*\(([^()]*)\)', re.IGNORECASE)
+
+
+def get_convex_hull(vertices, method='qhull'):
     '''
     Compute the convex hull of the polygon.
 
@@ -20,108 +32,625 @@ def get_convex_hull(vertices_set):
     fewer vertices than the original polygon.  This should reduce cvxpy
     constraints and run time for concave polygons with many vertices.
 
-    Uses scipy.ConvexHull.
+    Uses scipy.ConvexHull or a monotone chain after an Akl-Toussaint
+    pre-filter, see convex_hull_indices.
 
-    :param vertices_set: Set of (x, y) tuples representing the polygon vertices
-    :return: hull_vertices Set of (x, y) tuples representing the convex hull
-                           of the polygon vertices
+    :param vertices: (n, 2) array of polygon vertices
+    :param method: Hull algorithm, qhull or monotone
+    :return: hull_vertices (m, 2) array of the convex hull vertices in
+                           counter-clockwise order
     '''
 
-    # Convert set to list for ConvexHull function.
-    vertices = list(vertices_set)
     vertices_len = len(vertices)
 
     # Compute the convex hull of the polygon.
-    hull = ConvexHull(vertices)
+    hull_index = convex_hull_indices(vertices, method)
 
     # Extract convex hull vertices.
-    hull_vertices = [vertices[hull_vertex] for hull_vertex in hull.vertices]
-    hull_vertices_set = set(hull_vertices)
-    hull_vertices_len = len(hull_vertices_set)
-    print_v('Convex hull vertices:', hull_vertices_set)
+    hull_vertices = vertices[hull_index]
+    hull_vertices_len = len(hull_vertices)
+    print_v('Convex hull vertices:', hull_vertices.tolist())
 
-    # Warn about vertex removal.
+    # Warn about vertex removal, listing up to 100 removed vertices.
     if hull_vertices_len < vertices_len:
         vertices_diff = vertices_len - hull_vertices_len
         print(f'Warning - convex hull calculation removes {vertices_diff} vertices:')
-        print('\t', vertices_set - hull_vertices_set)
+        if vertices_diff <= 100:
+            removed = np.ones(vertices_len, dtype=bool)
+            removed[hull_index] = False
+            print('\t', vertices[removed].tolist())
+
+    return hull_vertices
+
+
+def akl_toussaint_mask(points, block=2 ** 14):
+    '''
+    Find points which may be convex hull vertices.
+
+    Akl-Toussaint heuristic.  The points extreme in the directions of x, y,
+    x + y and x - y, both ways, are hull vertices and span an octagon inside
+    the hull.  Points strictly inside the octagon cannot be hull vertices.
+    Vectorised over blocks of points, all octagon edges per block.
+
+    :param points: (n, 2) array of points
+    :param block: Points per block
+    :return: (n,) boolean array, False for points strictly inside the octagon
+    '''
+
+    x, y = points[:, 0], points[:, 1]
+
+    # Extreme points in counter-clockwise order of direction.
+    extremes = [np.argmax(x), np.argmax(x + y), np.argmax(y), np.argmax(y - x),
+                np.argmin(x), np.argmin(x + y), np.argmin(y), np.argmin(y - x)]
+    octagon = points[extremes]
+
+    # Drop repeated corners.
+    distinct = np.any(octagon != np.roll(octagon, 1, axis=0), axis=1)
+    octagon = octagon[distinct]
+
+    if len(octagon) < 3:
+        return np.ones(len(points), dtype=bool)
+
+    # Strictly left of every counter-clockwise edge is strictly inside.
+    # Edges as d_x * y - d_y * x > c, tested in cache sized blocks.
+    edges = [(b_x - a_x, b_y - a_y, (b_x - a_x) * a_y - (b_y - a_y) * a_x)
+             for (a_x, a_y), (b_x, b_y) in zip(octagon, np.roll(octagon, -1, axis=0))]
+    keep = np.empty(len(points), dtype=bool)
+
+    for start in range(0, len(points), block):
+        x_b, y_b = x[start:start + block], y[start:start + block]
+        inside = np.ones(len(x_b), dtype=bool)
+        for d_x, d_y, c in edges:
+            inside &= d_x * y_b - d_y * x_b > c
+        keep[start:start + block] = ~inside
+
+    return keep
+
+
+def monotone_chain_hull(points):
+    '''
+    Compute convex hull with Andrew's monotone chain algorithm.
+
+    Sorts the points by x then y and builds the lower and upper hulls in
+    one pass each.  Collinear boundary points are not hull vertices.
+
+    :param points: (n, 2) array of distinct points
+    :return: Indices of hull vertices in counter-clockwise order
+    '''
+
+    order = np.lexsort((points[:, 1], points[:, 0]))
+    sorted_points = points[order].tolist()
+
+    def half_hull(indices):
+        chain = []
+        for k in indices:
+            p_x, p_y = sorted_points[k]
+            while len(chain) >= 2:
+                (o_x, o_y), (a_x, a_y) = sorted_points[chain[-2]], sorted_points[chain[-1]]
+                if (a_x - o_x) * (p_y - o_y) - (a_y - o_y) * (p_x - o_x) > 0:
+                    break
+                chain.pop()
+            chain.append(k)
+        return chain
+
+    lower = half_hull(range(len(sorted_points)))
+    upper = half_hull(reversed(range(len(sorted_points))))
+
+    # Last point of each half is the first of the other.
+    return order[lower[:-1] + upper[:-1]]
+
+
+def qhull_hull(points):
+    '''
+    Compute convex hull with scipy.ConvexHull (Qhull).
+
+    :param points: (n, 2) array of distinct points
+    :return: Indices of hull vertices in counter-clockwise order
+    '''
+
+    from scipy.spatial import ConvexHull
+
+    return ConvexHull(points).vertices
+
 
-    return hull_vertices_set
+# Convex hull algorithms selectable on the command line.
+HULL_METHODS = {'qhull': qhull_hull,
+                'monotone': monotone_chain_hull}
+
+
+def convex_hull_indices(points, method='qhull'):
+    '''
+    Compute convex hull after discarding points that cannot be on it.
+
+    Points strictly inside the Akl-Toussaint octagon are dropped before
+    removing duplicates, so only the survivors are sorted and passed to
+    the hull algorithm.
+
+    :param points: (n, 2) array of points
+    :param method: Hull algorithm, qhull or monotone
+    :return: Indices into points of hull vertices in counter-clockwise order
+    '''
+
+    candidates = np.flatnonzero(akl_toussaint_mask(points))
+    _, first = np.unique(points[candidates], axis=0, return_index=True)
+    candidates = candidates[first]
+
+    return candidates[HULL_METHODS[method](points[candidates])]
+
+
+def chunked_convex_hull(points, chunk_size=10 ** 6, method='qhull'):
+    '''
+    Compute convex hull of points one chunk at a time.
+
+    Each chunk is merged with the hull of the chunks before it, so only
+    chunk_size points plus a hull are in memory at once.  points can be a
+    memory-mapped array, e.g. from np.load(filename, mmap_mode='r').
+
+    :param points: (n, 2) array of points
+    :param chunk_size: Points per chunk
+    :param method: Hull algorithm, qhull or monotone
+    :return: (m, 2) array of convex hull vertices in counter-clockwise order
+    '''
+
+    hull = np.empty((0, 2))
+
+    for start in range(0, len(points), chunk_size):
+        chunk = np.asarray(points[start:start + chunk_size], dtype=np.float64)
+        merged = np.concatenate([hull, chunk])
+        hull = merged[convex_hull_indices(merged, method)]
+        print_v(f'Hull of first {start + len(chunk)} points has {len(hull)} vertices')
+
+    return hull
+
+
+def load_points(filename):
+    '''
+    Memory-map (n, 2) array of points from a .npy file.
+
+    :param filename: .npy file name
+    :return: (n, 2) memory-mapped array
+    '''
+
+    points = np.load(filename, mmap_mode='r')
+
+    if points.ndim != 2 or points.shape[1] != 2:
+        print('Points must be 2 dimensional:', filename)
+        print('Points shape:', points.shape)
+        sys.exit()
+
+    return points
 
 
 def check_vertices(vertices):
     '''
     Check vertices for problems.
 
-    Must be at least 3 vertices.
-    Vertices must all be tuples.
-    Vertices must all be 2 dimensional.
+    Vertices must form an (n, 2) numeric array.
+    Vertices must all be finite.
+    Must be at least 3 distinct vertices.
 
-    :param vertices: Set of (x, y) tuples representing the polygon vertices
+    :param vertices: Array-like of (x, y) polygon vertices
+    :return: (n, 2) float64 array of the vertices
     '''
 
-    # Must be at least 3 vertices.
-    if len(vertices) < 3:
-        print('Must be at least 3 vertices:', vertices)
+    # Vertices must all be 2 dimensional.
+    try:
+        vertices = np.asarray(vertices, dtype=np.float64)
+    except (TypeError, ValueError):
+        print('Vertices must all be numeric (x, y) pairs:', vertices)
         sys.exit()
 
-    # Vertices must all be tuples.
-    if not all(isinstance(vertex, tuple) for vertex in vertices):
-        print('Vertices must all be tuples:', vertices)
+    if vertices.ndim != 2 or vertices.shape[1] != 2:
+        print('Vertices must be 2 dimensional:', vertices)
+        print('Vertices shape:', vertices.shape)
         sys.exit()
 
-    # Vertices must all be 2 dimensional.
-    vertex_sizes = [len(p) for p in vertices]
+    # Vertices must all be finite.
+    finite = np.isfinite(vertices).all(axis=1)
+    if not finite.all():
+        print('Vertices must all be finite:', vertices[~finite].tolist())
+        sys.exit()
 
-    if not all(vertex_size == 2 for vertex_size in vertex_sizes):
-        vertex_size_min = min(vertex_sizes)
-        vertex_size_max = max(vertex_sizes)
-        print('Vertices must be 2 dimensional:', vertices)
-        print('Vertex sizes:', vertex_sizes)
-        print(f'Vertex size - min, max: {vertex_size_min}, {vertex_size_max}')
+    # Must be at least 3 distinct vertices.
+    if len(np.unique(vertices, axis=0)) < 3:
+        print('Must be at least 3 vertices:', vertices.tolist())
         sys.exit()
 
+    return vertices
+
 
-def minimum_enclosing_circle(vertices):
+class EnclosingCircleProblem:
     '''
-    Find minimum enclosing circle for a polygon.
+    Reusable cvxpy minimum enclosing circle problem.
 
     Uses cvxpy with Euclidean distance constraints.
     Euclidean distance from each vertex to the circle center should be
     less than or equal to circle radius.
     The cvxpy objective is to minimise the enclosing circle radius.
 
-    :param vertices: Set of (x, y) tuples representing the polygon vertices
+    The vertices are a cp.Parameter, so the problem is DPP compliant and
+    cvxpy canonicalises it only on the first solve.  One problem is built
+    per vertex count, rounded up to a power of two by repeating the first
+    vertex, which leaves the circle unchanged.  Later solves warm start
+    from the previous solution.
+    '''
+
+    def __init__(self, solver=None):
+        '''
+        :param solver: cvxpy solver name, e.g. CLARABEL or SCS, None for
+                       the cvxpy default
+        '''
+
+        self.solver = solver
+        self.problems = {}
+
+    def _problem(self, size):
+        '''
+        Get or build the problem for size vertices.
+
+        :param size: Number of vertices
+        :return: Problem, vertices parameter, center and radius variables
+        '''
+
+        import cvxpy as cp
+
+        if size not in self.problems:
+            # Parameter for the (size, 2) vertex coordinates.
+            vertices = cp.Parameter((size, 2))
+
+            # Variables for the center of the circle (c_x, c_y) and the radius.
+            center = cp.Variable(2)
+            radius = cp.Variable(nonneg=True)
+
+            # Constraints:
+            # Euclidean distance from each vertex to the center should be <= radius
+            # One row-wise cp.norm over all vertices - Euclidean distances
+            constraints = [cp.norm(vertices - center[None, :], 2, axis=1) <= radius]
+
+            # Formulate the problem, minimising the radius.
+            problem = cp.Problem(cp.Minimize(radius), constraints)
+            self.problems[size] = (problem, vertices, center, radius)
+
+        return self.problems[size]
+
+    def solve(self, vertices):
+        '''
+        Find minimum enclosing circle for a polygon.
+
+        :param vertices: (n, 2) array of polygon vertices
+        :return: Center (x, y) and radius of the minimal enclosing circle
+        :raises RuntimeError: If the solver does not reach an optimal solution
+        '''
+
+        import cvxpy as cp
+
+        vertices = np.asarray(vertices, dtype=np.float64)
+
+        # Pad vertices to the problem size with copies of the first vertex.
+        size = max(4, 1 << (len(vertices) - 1).bit_length())
+        problem, vertices_param, center, radius = self._problem(size)
+        vertices_param.value = np.concatenate(
+                [vertices, np.repeat(vertices[:1], size - len(vertices), axis=0)])
+
+        # Solve the problem, failures are raised for the caller to handle.
+        try:
+            problem.solve(solver=self.solver, warm_start=True)
+        except cp.error.SolverError as err:
+            raise RuntimeError(f'Solver failed to find a solution: {err}') from err
+
+        # Check problem status.
+        if problem.status != cp.OPTIMAL:
+            raise RuntimeError(f'Solver failed to find a solution, status {problem.status}')
+
+        # Return the center coordinates and the radius.
+        return center.value.copy(), float(radius.value)
+
+
+# Reusable cvxpy problems by cvxpy solver name.
+_circle_problems = {}
+
+
+def minimum_enclosing_circle(vertices, solver=None):
+    '''
+    Find minimum enclosing circle for a polygon.
+
+    Solves a cached EnclosingCircleProblem, so repeated calls reuse the
+    compiled cvxpy problem.
+
+    :param vertices: (n, 2) array of polygon vertices
+    :param solver: cvxpy solver name, None for the cvxpy default
     :return: Center (x, y) and radius of the minimal enclosing circle
+    :raises RuntimeError: If the solver does not reach an optimal solution
     '''
 
-    # Variables for the center of the circle (c_x, c_y) and the radius.
-    center = cp.Variable(2)
-    radius = cp.Variable(nonneg=True)
+    if solver not in _circle_problems:
+        _circle_problems[solver] = EnclosingCircleProblem(solver)
 
-    # Objective: Minimize the radius.
-    objective = cp.Minimize(radius)
+    return _circle_problems[solver].solve(vertices)
 
-    # Constraints:
-    # Euclidean distance from each vertex to the center should be <= radius
-    # cp.hstack - Horizontal concatenation of arguments
-    # cp.norm - Euclidean distance
-    constraints = [cp.norm(cp.hstack(vertex - center), 2) <= radius
-                   for vertex in vertices]
 
-    # Formulate the problem.
-    problem = cp.Problem(objective, constraints)
+def _circle_two_points(p, q):
+    '''
+    Smallest circle through two points, with p and q on its diameter.
 
-    # Solve the problem.
-    problem.solve()
+    :param p: (x, y) tuple
+    :param q: (x, y) tuple
+    :return: Center (x, y) and radius
+    '''
 
-    # Check problem status.
-    if problem.status != cp.OPTIMAL:
-        print('Solver failed to find a solution')
-        sys.exit()
+    center = ((p[0] + q[0]) / 2, (p[1] + q[1]) / 2)
+
+    return center, math.dist(center, p)
+
+
+def _circle_three_points(p, q, r):
+    '''
+    Smallest circle with three points on its boundary.
+
+    Circumcircle of the triangle p, q, r.  Collinear points have no
+    circumcircle, so the circle on the two points furthest apart is used.
+
+    :param p: (x, y) tuple
+    :param q: (x, y) tuple
+    :param r: (x, y) tuple
+    :return: Center (x, y) and radius
+    '''
+
+    # Translate p to the origin for numerical stability.
+    b_x, b_y = q[0] - p[0], q[1] - p[1]
+    c_x, c_y = r[0] - p[0], r[1] - p[1]
+    d = 2 * (b_x * c_y - b_y * c_x)
+
+    if d == 0:
+        pairs = [(p, q), (p, r), (q, r)]
+        return _circle_two_points(*max(pairs, key=lambda pair: math.dist(*pair)))
+
+    b_sq = b_x * b_x + b_y * b_y
+    c_sq = c_x * c_x + c_y * c_y
+    u_x = (c_y * b_sq - b_y * c_sq) / d
+    u_y = (b_x * c_sq - c_x * b_sq) / d
+
+    return (p[0] + u_x, p[1] + u_y), math.hypot(u_x, u_y)
+
+
+def _first_outside(points, start, stop, center, radius, rel_tol=1e-12):
+    '''
+    Find first point outside circle, allowing for rounding error.
+
+    :param points: (n, 2) array of points, or list of (x, y) for few points
+    :param start: First index to check
+    :param stop: Index after last to check
+    :param center: Center (x, y) of circle
+    :param radius: Radius of circle
+    :param rel_tol: Tolerance relative to radius
+    :return: Index of first point in points[start:stop] outside circle,
+             stop if there is none
+    '''
+
+    limit = radius * (1 + rel_tol) + rel_tol
+
+    # Plain loop for small lists, cheaper than numpy calls.
+    if isinstance(points, list):
+        for k in range(start, stop):
+            if math.dist(points[k], center) > limit:
+                return k
+        return stop
+
+    # Doubling blocks, so the cost is proportional to the distance scanned.
+    block = 32
+    while start < stop:
+        end = min(start + block, stop)
+        dist = np.hypot(points[start:end, 0] - center[0], points[start:end, 1] - center[1])
+        outside = np.flatnonzero(dist > limit)
+
+        if len(outside):
+            return start + outside[0]
+
+        start, block = end, 2 * block
+
+    return stop
+
+
+# Welzl scans at most this many points with plain Python rather than numpy.
+WELZL_LIST_POINTS = 2000
+
+
+def _shuffled_points(vertices, rng):
+    '''
+    Shuffle points for Welzl's algorithm.
+
+    :param vertices: (n, 2) array of points
+    :param rng: numpy random Generator
+    :return: Shuffled (n, 2) array, or list of (x, y) for few points
+    '''
+
+    points = rng.permutation(np.asarray(vertices, dtype=np.float64).reshape(-1, 2))
+
+    return points.tolist() if len(points) <= WELZL_LIST_POINTS else points
+
+
+def _circle_with_point(points, stop, p):
+    '''
+    Find minimum enclosing circle of points[:stop] and p, with p on its boundary.
+
+    Inner loops of Welzl's algorithm.  Correct when p is outside the
+    minimum enclosing circle of points[:stop], expected O(stop) time when
+    the points are in random order.
+
+    :param points: (n, 2) array of points, or list of (x, y) for few points
+    :param stop: Number of points to enclose
+    :param p: (x, y) tuple on the boundary
+    :return: Center (x, y) and radius of the minimal enclosing circle
+    '''
 
-    # Return the center coordinates and the radius.
-    return center.value, radius.value
+    center, radius = p, 0.0
+
+    j = _first_outside(points, 0, stop, center, radius)
+    while j < stop:
+        # p and q are on the boundary of the circle of points[:j + 1] + [p].
+        q = tuple(points[j])
+        center, radius = _circle_two_points(p, q)
+
+        k = _first_outside(points, 0, j, center, radius)
+        while k < j:
+            center, radius = _circle_three_points(p, q, tuple(points[k]))
+            k = _first_outside(points, k + 1, j, center, radius)
+
+        j = _first_outside(points, j + 1, stop, center, radius)
+
+    return center, radius
+
+
+def welzl_enclosing_circle(vertices, seed=None):
+    '''
+    Find minimum enclosing circle with randomised incremental algorithm.
+
+    Iterative form of Welzl's algorithm (Welzl 1991, after Seidel).
+    Points are shuffled then added one at a time.  Only a point outside the
+    current circle changes it, and the new circle must have that point on
+    its boundary, so the search restarts with one and then two boundary
+    points fixed.  Expected O(n) time for n points.  Each loop jumps
+    straight to the next point outside the circle with a vectorised scan.
+
+    :param vertices: (n, 2) array of polygon vertices
+    :param seed: Seed for shuffling the points
+    :return: Center (x, y) and radius of the minimal enclosing circle
+    '''
+
+    # Random order gives expected linear time.
+    points = _shuffled_points(vertices, np.random.default_rng(seed))
+    num_points = len(points)
+
+    center, radius = tuple(points[0]), 0.0
+
+    i = _first_outside(points, 0, num_points, center, radius)
+    while i < num_points:
+        # p is on the boundary of the circle of points[:i + 1].
+        center, radius = _circle_with_point(points, i, tuple(points[i]))
+        i = _first_outside(points, i + 1, num_points, center, radius)
+
+    return center, radius
+
+
+class StreamingEnclosingCircle:
+    '''
+    Minimum enclosing circle of a stream of points.
+
+    Points are added one at a time, optionally keeping only the last
+    window points.  A point inside the current circle leaves it unchanged,
+    O(1).  A point outside it is on the boundary of the new circle, so only
+    the inner loops of Welzl's algorithm run, expected O(n).  Dropping a
+    point strictly inside the circle from the window leaves it unchanged,
+    dropping a boundary point marks the circle for a full recompute at the
+    next query.
+    '''
+
+    def __init__(self, window=None, seed=None, rel_tol=1e-9):
+        '''
+        :param window: Keep only the last window points, None for all
+        :param seed: Seed for shuffling points in recomputes
+        :param rel_tol: Points this close to the boundary, relative to the
+                        radius, count as on the boundary when dropped
+        '''
+
+        self.points = collections.deque(maxlen=window)
+        self.rng = np.random.default_rng(seed)
+        self.rel_tol = rel_tol
+        self.center = None
+        self.radius = 0.0
+        self.stale = False
+
+    def __len__(self):
+        return len(self.points)
+
+    def add(self, point):
+        '''
+        Add a point, dropping the oldest point if the window is full.
+
+        :param point: (x, y) coordinates
+        '''
+
+        point = (float(point[0]), float(point[1]))
+
+        # Oldest point leaves the window, the circle may shrink.
+        if len(self.points) == self.points.maxlen:
+            dropped = self.points.popleft()
+            if not self.stale and \
+                    math.dist(dropped, self.center) >= self.radius * (1 - self.rel_tol):
+                self.stale = True
+
+        if self.center is None:
+            self.center, self.radius = point, 0.0
+        elif not self.stale and _first_outside([point], 0, 1, self.center, self.radius) == 0:
+            # New point outside the circle is on the boundary of the new circle.
+            points = _shuffled_points(self.points, self.rng) if self.points else []
+            self.center, self.radius = _circle_with_point(points, len(points), point)
+
+        self.points.append(point)
+
+    def extend(self, points):
+        '''
+        Add points in order.
+
+        :param points: Iterable of (x, y) coordinates
+        '''
+
+        for point in points:
+            self.add(point)
+
+    def circle(self):
+        '''
+        Minimum enclosing circle of the points in the window.
+
+        :return: Center (x, y) and radius, center None if there are no points
+        '''
+
+        if self.stale:
+            self.center, self.radius = welzl_enclosing_circle(
+                    self.points, seed=self.rng.integers(2 ** 32))
+            self.stale = False
+
+        return self.center, self.radius
+
+
+def ritter_enclosing_circle(vertices):
+    '''
+    Find approximate enclosing circle with Ritter's bounding sphere method.
+
+    Takes the circle on a pair of points found by two farthest point
+    searches, then grows it just enough to cover each point left outside.
+    Two passes over the points, the radius is typically within 5-20% of
+    the minimum.
+
+    :param vertices: (n, 2) array of polygon vertices
+    :return: Center (x, y) and radius of an enclosing circle
+    '''
+
+    points = np.asarray(vertices, dtype=np.float64)
+
+    # Approximate diameter from two farthest point searches.
+    p = points[np.argmax(np.hypot(*(points - points[0]).T))]
+    q = points[np.argmax(np.hypot(*(points - p).T))]
+    (c_x, c_y), radius = _circle_two_points(p, q)
+
+    # Grow circle to cover every point, only points outside the first
+    # circle can be outside a grown one.
+    outside = np.hypot(points[:, 0] - c_x, points[:, 1] - c_y) > radius
+    for (x, y) in points[outside].tolist():
+        dist = math.hypot(x - c_x, y - c_y)
+        if dist > radius:
+            radius_new = (radius + dist) / 2
+            shift = (radius_new - radius) / dist
+            c_x, c_y = c_x + (x - c_x) * shift, c_y + (y - c_y) * shift
+            radius = radius_new
+
+    return (c_x, c_y), radius
+
+
+# Enclosing circle solvers selectable on the command line.
+SOLVERS = {'cvxpy': minimum_enclosing_circle,
+           'welzl': welzl_enclosing_circle,
+           'ritter': ritter_enclosing_circle}
 
 
 def describe_circle(center, radius):
@@ -146,7 +675,7 @@ def get_vertices(args):
     inside a 2D plane.
 
     :param args: argparse arguments
-    :return: Set of tuples containing 2D coordinates
+    :return: (n, 2) array of 2D coordinates
     '''
 
     if args.radius is not None:
@@ -158,21 +687,245 @@ def get_vertices(args):
     else:
         # Use hardcoded vertices.
         # Triangle
-        # vertices = {(0, 0), (2, 0), (2, 2)}
+        # vertices = np.array([(0, 0), (2, 0), (2, 2)])
         # Square
-        # vertices = {(0, 0), (0, 2), (2, 0), (2, 2)}
+        # vertices = np.array([(0, 0), (0, 2), (2, 0), (2, 2)])
         # Irregular pentagon
-        # vertices = {(0, 0), (0, 2), (2, 0), (2, 2), (1, 3)}
+        # vertices = np.array([(0, 0), (0, 2), (2, 0), (2, 2), (1, 3)])
         # Bow tie - concave
-        # vertices = {(0, 0), (1, 1), (2, 2), (2, 4), (1, 3), (0, 4)}
+        # vertices = np.array([(0, 0), (1, 1), (2, 2), (2, 4), (1, 3), (0, 4)])
         # 5-sided star
-        vertices = {(0, 100), (59, 81), (95, 31), (36, -12), (59, -81),
-                    (-59, -81), (-36, -12), (-95, 31), (-59, 81)}
-        print('Hardcoded polygon:', vertices)
+        vertices = np.array([(0, 100), (59, 81), (95, 31), (36, -12), (59, -81),
+                             (-59, -81), (-36, -12), (-95, 31), (-59, 81)], dtype=np.float64)
+        print('Hardcoded polygon:', vertices.tolist())
 
     return vertices
 
 
+def parse_wkt_polygon(text):
+    '''
+    Parse the outer ring of a WKT POLYGON.
+
+    :param text: WKT string such as 'POLYGON ((0 0, 2 0, 2 2, 0 0))'
+    :return: (n, 2) array of vertices
+    '''
+
+    match = WKT_POLYGON.match(text)
+    if match is None:
+        raise ValueError(f'Not a WKT POLYGON: {text[:80]!r}')
+
+    # Outer ring is the first parenthesised list, holes are ignored.
+    ring = match.group(1)
+
+    return np.array([point.split() for point in ring.split(',')], dtype=np.float64)
+
+
+def parse_polygon(line, fmt='ndjson', line_num=0):
+    '''
+    Parse one polygon line.
+
+    ndjson - JSON object with a "vertices" list of [x, y] pairs and an
+             optional "id"
+    wkt    - WKT POLYGON, optionally preceded by an id and a tab
+
+    Vertices must form a non-empty (n, 2) array of finite numbers.
+
+    :param line: Line of text
+    :param fmt: Input format, ndjson or wkt
+    :param line_num: Line number, used as id if the line has none
+    :return: id, (n, 2) array of vertices
+    '''
+
+    try:
+        if fmt == 'ndjson':
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError(f'expected a JSON object, got {type(record).__name__}')
+            poly_id = record.get('id', line_num)
+            vertices = np.array(record['vertices'], dtype=np.float64)
+        else:
+            poly_id, _, wkt = line.rpartition('\t')
+            poly_id = poly_id or line_num
+            vertices = parse_wkt_polygon(wkt)
+    except (ValueError, KeyError, TypeError) as err:
+        raise ValueError(f'line {line_num}: {err}') from err
+
+    if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) == 0:
+        raise ValueError(f'line {line_num}: vertices must be 2 dimensional')
+
+    # Vertices must all be finite, "nan" and "inf" parse as floats.
+    finite = np.isfinite(vertices).all(axis=1)
+    if not finite.all():
+        raise ValueError(f'line {line_num}: vertices must all be finite: '
+                         f'{vertices[~finite].tolist()}')
+
+    return poly_id, vertices
+
+
+def read_lines(filename):
+    '''
+    Stream non-blank lines from a file.
+
+    :param filename: Input file name, '-' for stdin
+    :return: Generator of (line number, line)
+    '''
+
+    with (contextlib.nullcontext(sys.stdin) if filename == '-' else open(filename)) as fh:
+        for line_num, line in enumerate(fh, 1):
+            if line.strip():
+                yield line_num, line
+
+
+def read_polygons(filename, fmt='ndjson'):
+    '''
+    Stream polygons from a file one line at a time, see parse_polygon.
+
+    :param filename: Input file name, '-' for stdin
+    :param fmt: Input format, ndjson or wkt
+    :return: Generator of (id, (n, 2) array of vertices)
+    '''
+
+    for line_num, line in read_lines(filename):
+        yield parse_polygon(line, fmt, line_num)
+
+
+def enclosing_circle(vertices, solver='welzl', cvxpy_solver=None):
+    '''
+    Find enclosing circle of points without printing anything.
+
+    The cvxpy solver gets the convex hull of the points to reduce its
+    constraints, unless the points have no 2D hull, e.g. are collinear.
+    Welzl and Ritter are linear in the number of points, so get them all.
+
+    :param vertices: (n, 2) array of vertices
+    :param solver: Name of solver in SOLVERS
+    :param cvxpy_solver: cvxpy solver name for the cvxpy solver
+    :return: Center (x, y) and radius of the enclosing circle
+    '''
+
+    if solver == 'cvxpy':
+        from scipy.spatial import ConvexHull, QhullError
+
+        try:
+            vertices = vertices[ConvexHull(vertices).vertices]
+        except (QhullError, ValueError):
+            vertices = np.unique(vertices, axis=0)
+
+        return minimum_enclosing_circle(vertices, cvxpy_solver)
+
+    return SOLVERS[solver](vertices)
+
+
+def _batch_circles(lines, fmt, solver, cvxpy_solver=None):
+    '''
+    Enclosing circles for a batch of polygon lines, run in a worker process.
+
+    :param lines: List of (line number, line)
+    :param fmt: Input format, ndjson or wkt
+    :param solver: Name of solver in SOLVERS
+    :param cvxpy_solver: cvxpy solver name for the cvxpy solver
+    :return: List of (id, center x, center y, radius) tuples
+    '''
+
+    results = []
+    for line_num, line in lines:
+        poly_id, vertices = parse_polygon(line, fmt, line_num)
+
+        # Solver failures are reported with the line, never exit the worker.
+        try:
+            (c_x, c_y), radius = enclosing_circle(vertices, solver, cvxpy_solver)
+        except RuntimeError as err:
+            raise ValueError(f'line {line_num}: {err}') from err
+
+        results.append((poly_id, float(c_x), float(c_y), float(radius)))
+
+    return results
+
+
+def batch_main(args):
+    '''
+    Enclosing circles for every polygon in a file.
+
+    Lines are read lazily in batches of args.batch_size, then parsed and
+    solved in args.workers processes.  At most two batches per worker are in flight,
+    so memory stays bounded however large the input is.  Results are
+    written as CSV in input order as soon as each batch finishes, and a
+    throughput report is printed to stderr.
+
+    :param args: Argparse command line arguments
+    '''
+
+    lines = read_lines(args.input)
+    batches = iter(lambda: list(itertools.islice(lines, args.batch_size)), [])
+
+    num_polygons = 0
+    start = time.perf_counter()
+
+    out_file = contextlib.nullcontext(sys.stdout) if args.output == '-' else \
+        open(args.output, 'w', newline='')
+
+    with out_file as out, multiprocessing.Pool(args.workers) as pool:
+        writer = csv.writer(out)
+        writer.writerow(['id', 'center_x', 'center_y', 'radius'])
+
+        pending = collections.deque()
+        for batch in itertools.chain(batches, [None]):
+            if batch is not None:
+                pending.append(pool.apply_async(_batch_circles,
+                                                (batch, args.format, args.solver,
+                                                 args.cvxpy_solver)))
+
+            # Write finished batches in order, blocking when too many are queued.
+            while pending and (batch is None or len(pending) >= 2 * args.workers
+                               or pending[0].ready()):
+                results = pending.popleft().get()
+                writer.writerows(results)
+                num_polygons += len(results)
+
+                if args.verbose:
+                    elapsed = time.perf_counter() - start
+                    print(f'{num_polygons} polygons, {num_polygons / elapsed:.0f} polygons/s',
+                          file=sys.stderr)
+
+    elapsed = time.perf_counter() - start
+    print(f'Processed {num_polygons} polygons in {elapsed:.2f} s '
+          f'({num_polygons / max(elapsed, 1e-9):.0f} polygons/s) '
+          f'with {args.workers} workers, solver {args.solver}', file=sys.stderr)
+
+
+def stream_main(args):
+    '''
+    Enclosing circle after every point of a stream.
+
+    Points are read one per line as "x,y" or "x y".  The circle of the
+    points so far, or of the last args.window points, is written as CSV
+    after each point.
+
+    :param args: Argparse command line arguments
+    '''
+
+    tracker = StreamingEnclosingCircle(args.window)
+    out_file = contextlib.nullcontext(sys.stdout) if args.output == '-' else \
+        open(args.output, 'w', newline='')
+
+    with out_file as out:
+        writer = csv.writer(out)
+        writer.writerow(['line', 'center_x', 'center_y', 'radius'])
+
+        for line_num, line in read_lines(args.stream):
+            try:
+                point = [float(coord) for coord in line.replace(',', ' ').split()]
+            except ValueError as err:
+                raise ValueError(f'line {line_num}: {err}') from err
+            if len(point) != 2:
+                raise ValueError(f'line {line_num}: point must be 2 dimensional')
+
+            tracker.add(point)
+            (c_x, c_y), radius = tracker.circle()
+            writer.writerow([line_num, c_x, c_y, radius])
+            out.flush()
+
+
 def main(args):
     '''
     Standard main function.
@@ -186,18 +939,50 @@ def main(args):
     :param args: Argparse command line arguments
     '''
 
-    # Get hardcoded vertices or generate a polygon or
-    # generate random points on 2D plane.
-    vertices = get_vertices(args)
-
-    # Check for problems with points/vertices.
-    check_vertices(vertices)
-
-    # Calculate convex hull of the points/vertices with scipy.
-    convex_hull = get_convex_hull(vertices)
-
-    # Find the minimal enclosing circle of the convex hull with cvxpy.
-    cen, rad = minimum_enclosing_circle(convex_hull)
+    # Batch mode for polygons from a file.
+    if args.input is not None:
+        try:
+            batch_main(args)
+        except ValueError as err:
+            print(f'Invalid polygon in {args.input}, {err}')
+            sys.exit()
+        return
+
+    # Streaming mode for points from a file.
+    if args.stream is not None:
+        try:
+            stream_main(args)
+        except ValueError as err:
+            print(f'Invalid point in {args.stream}, {err}')
+            sys.exit()
+        return
+
+    if args.points_file is not None:
+        # Memory-map points and calculate convex hull in chunks.
+        vertices = load_points(args.points_file)
+        convex_hull = chunked_convex_hull(vertices, args.chunk_size, args.hull)
+        print(f'Convex hull of {len(vertices)} points has {len(convex_hull)} vertices')
+    else:
+        # Get hardcoded vertices or generate a polygon or
+        # generate random points on 2D plane.
+        vertices = get_vertices(args)
+
+        # Check for problems with points/vertices.
+        vertices = check_vertices(vertices)
+
+        # Calculate convex hull of the points/vertices.
+        convex_hull = get_convex_hull(vertices, args.hull)
+
+    # Find the minimal enclosing circle of the convex hull with cvxpy,
+    # Welzl's algorithm or Ritter's approximation.
+    if args.solver == 'cvxpy':
+        try:
+            cen, rad = minimum_enclosing_circle(convex_hull, args.cvxpy_solver)
+        except RuntimeError as err:
+            print(err)
+            sys.exit()
+    else:
+        cen, rad = SOLVERS[args.solver](convex_hull)
 
     # Print description of minimal enclosing circle.
     describe_circle(cen, rad)
@@ -208,7 +993,7 @@ def generate_regular_polygon(args):
     Generates coordinates of a regular polygon.
 
     :param args: argparse arguments
-    :return: Set of tuples containing 2D coordinates of regular polygon
+    :return: (n, 2) array of 2D coordinates of regular polygon
     '''
 
     # Extract parameters from args.
@@ -222,18 +1007,11 @@ def generate_regular_polygon(args):
     assert num_points >= 3
 
     # Generate regular polygon.
-    regular_coords = []
-    angle = 2 * math.pi / num_points
-    for i in range(num_points):
-        # coords or tuples containing x, y coordinates
-        coords = (radius * math.cos(i * angle), radius * math.sin(i * angle))
-        regular_coords.append(coords)
-
-    # Convert list to set.
-    regular_coords_set = set(regular_coords)
-    print('Generated regular polygon:', regular_coords_set)
+    angles = 2 * np.pi * np.arange(num_points) / num_points
+    regular_coords = radius * np.column_stack([np.cos(angles), np.sin(angles)])
+    print('Generated regular polygon:', regular_coords.tolist())
 
-    return regular_coords_set
+    return regular_coords
 
 
 def generate_random_points(args):
@@ -243,7 +1021,7 @@ def generate_random_points(args):
     A set of n random points may not result in an n-sided polygon.
 
     :param args: argparse arguments
-    :return: Set of tuples containing random integer 2D coordinates
+    :return: (n, 2) array of distinct random integer 2D coordinates
     '''
 
     # Extract parameters from args.
@@ -259,18 +1037,15 @@ def generate_random_points(args):
     assert min_coord < max_coord
 
     # Generate random 2D integer points.
-    random_coords = []
-    for _ in range(num_points):
-        # coords or tuples containing random integer coordinates
-        coords = (random.randint(min_coord, max_coord),
-                  random.randint(min_coord, max_coord))
-        random_coords.append(coords)
+    rng = np.random.default_rng()
+    random_coords = rng.integers(min_coord, max_coord, size=(num_points, 2),
+                                 endpoint=True).astype(np.float64)
 
-    # Convert list to set.
-    random_coords_set = set(random_coords)
-    print('Generated random 2D integer points:', random_coords_set)
+    # Remove duplicate points.
+    random_coords = np.unique(random_coords, axis=0)
+    print('Generated random 2D integer points:', random_coords.tolist())
 
-    return random_coords_set
+    return random_coords
 
 
 def _int_range(int_min=None, int_max=None):
@@ -299,6 +1074,26 @@ def _int_range(int_min=None, int_max=None):
     return check_range
 
 
+def _cvxpy_solver(solver):
+    '''
+    Check cvxpy solver argument is an installed solver.
+
+    Imports cvxpy only when the argument is given.
+
+    :param solver: cvxpy solver name, any case
+    :return: Upper case solver name
+    '''
+
+    import cvxpy as cp
+
+    solver = solver.upper()
+    if solver not in cp.installed_solvers():
+        raise argparse.ArgumentTypeError("%r not in installed solvers %r"
+                % (solver, cp.installed_solvers()))
+
+    return solver
+
+
 if __name__ == "__main__":
     # Command line argument handling with argparse.
     parser = argparse.ArgumentParser(
@@ -309,6 +1104,67 @@ if __name__ == "__main__":
             help='Print additional information - default=%(default)s',
             default=False, action="store_true")
 
+    # Enclosing circle solver.
+    parser.add_argument('-so', '--solver',
+            help='Enclosing circle solver, ritter is approximate - default=%(default)s',
+            default='cvxpy', choices=list(SOLVERS))
+
+    # Backend for the cvxpy solver.
+    parser.add_argument('-cv', '--cvxpy_solver',
+            help='cvxpy solver backend for -so cvxpy, e.g. CLARABEL or SCS - default=%(default)s',
+            default=None, type=_cvxpy_solver, metavar='SOLVER')
+
+    # Convex hull algorithm.
+    parser.add_argument('-hu', '--hull',
+            help='Convex hull algorithm after Akl-Toussaint pre-filter - default=%(default)s',
+            default='qhull', choices=list(HULL_METHODS))
+
+    # Large point cloud options.
+    cloud = parser.add_argument_group(
+            'Optional arguments for large point clouds',
+            'Enclosing circle of points in a .npy file, memory-mapped')
+    cloud.add_argument('-pf', '--points_file',
+            help='.npy file holding (n, 2) array of points',
+            default=None, type=str)
+    cloud.add_argument('-cs', '--chunk_size',
+            help='Points per convex hull chunk - default=%(default)s',
+            default=10 ** 6, type=_int_range(3, 10 ** 9),
+            metavar="[3, 10 ** 9]")
+
+    # Batch mode options.
+    batch = parser.add_argument_group(
+            'Optional arguments for batch mode',
+            'Enclosing circles for every polygon in --input, written as CSV')
+    batch.add_argument('-in', '--input',
+            help='Polygon file, one polygon per line, - for stdin',
+            default=None, type=str)
+    batch.add_argument('-fm', '--format',
+            help='Polygon file format - default=%(default)s',
+            default='ndjson', choices=['ndjson', 'wkt'])
+    batch.add_argument('-o',  '--output',
+            help='CSV output file, - for stdout - default=%(default)s',
+            default='-', type=str)
+    batch.add_argument('-w',  '--workers',
+            help='Worker processes - default=%(default)s',
+            default=multiprocessing.cpu_count(), type=_int_range(1, 1024),
+            metavar="[1, 1024]")
+    batch.add_argument('-bs', '--batch_size',
+            help='Polygons per worker task - default=%(default)s',
+            default=1000, type=_int_range(1, 1000000),
+            metavar="[1, 1000000]")
+
+    # Streaming mode options.
+    stream = parser.add_argument_group(
+            'Optional arguments for streaming mode',
+            'Enclosing circle after each point in --stream, written as CSV to --output')
+    stream.add_argument('-sf', '--stream',
+            help='Point file, one "x,y" or "x y" per line, - for stdin',
+            default=None, type=str)
+    stream.add_argument('-sw', '--window',
+            help='Enclose only the last window points - default=%(default)s',
+            default=None, type=_int_range(1, 10 ** 9),
+            metavar="[1, 10 ** 9]")
+
     # Number of points/vertices to generate.
     # For use with both regular polygon and random point generation.
     gen_points = parser.add_argument_group(
@@ -0,0 +1,103 @@
+'''Check command line startup of the scripts stays within an import time budget'''
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+
+# Scripts checked with --help, heavy packages must not be imported for it
+SCRIPTS = ['tech_test_q1.py', 'polygon_inside_circle.py']
+HEAVY_MODULES = ['pandas', 'scipy', 'statsmodels', 'sklearn', 'cvxpy']
+
+# "import time: self [us] | cumulative | imported package" lines of -X importtime
+IMPORT_TIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def import_times(script, args=('-h',)):
+    '''Run script under python -X importtime
+    Returns {module: cumulative microseconds} for top level imports and
+    the set of every module imported.
+    '''
+
+    proc = subprocess.run([sys.executable, '-X', 'importtime', script, *args],
+                          cwd=os.path.dirname(os.path.abspath(__file__)),
+                          capture_output=True, text=True, check=True)
+
+    top_level = {}
+    modules = set()
+
+    for line in proc.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            continue
+
+        _, cumulative, indent, module = match.groups()
+        modules.add(module)
+        if not indent:
+            top_level[module] = int(cumulative)
+
+    return top_level, modules
+
+
+def check_script(script, budget_ms, repeats=5, verbose=False):
+    '''Best of repeats total import time of script --help against budget_ms
+    Returns list of failure messages, empty if within budget.
+    '''
+
+    runs = [import_times(script) for _ in range(repeats)]
+    top_level, modules = min(runs, key=lambda run: sum(run[0].values()))
+    total_ms = sum(top_level.values()) / 1000
+
+    print('%-28s %8.1f ms imports (budget %g ms)' % (script, total_ms, budget_ms))
+
+    if verbose:
+        for module, usecs in sorted(top_level.items(), key=lambda kv: -kv[1])[:10]:
+            print('    %-24s %8.1f ms' % (module, usecs / 1000))
+
+    failures = []
+
+    if total_ms > budget_ms:
+        failures.append('%s: imports take %.1f ms, budget %g ms' % (script, total_ms, budget_ms))
+
+    heavy = sorted({module.split('.')[0] for module in modules} & set(HEAVY_MODULES))
+    if heavy:
+        failures.append('%s: --help imports %s' % (script, ', '.join(heavy)))
+
+    return failures
+
+
+def main(argv):
+    '''Check every script, exit with status 1 on any failure'''
+
+    failures = []
+    for script in argv.scripts:
+        failures += check_script(script, argv.budget_ms, argv.repeats, argv.verbose)
+
+    if failures:
+        print('\nStartup regression:\n  ' + '\n  '.join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description='Check script startup import time stays within budget')
+
+    opts = parser.add_argument_group('optional arguments')
+    opts.add_argument('-v',  '--verbose',
+                      help='Print slowest top level imports - default=%(default)s',
+                      default=False, action="store_true")
+    opts.add_argument('-sc', '--scripts',
+                      help='Scripts to check with --help - default=%(default)s',
+                      default=SCRIPTS, nargs='+')
+    opts.add_argument('-b',  '--budget_ms',
+                      help='Total import time budget per script in ms - default=%(default)s',
+                      default=250, type=float)
+    opts.add_argument('-r',  '--repeats',
+                      help='Runs per script, the fastest counts - default=%(default)s',
+                      default=5, type=int)
+
+    args = parser.parse_args()
+
+    main(args)
@@ -0,0 +1,222 @@
+'''Approximate nearest neighbour search over surgeon notification time kdes'''
+
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+import tech_test_q1 as tt
+
+
+class DensityIndex:
+    '''Approximate nearest neighbour index over surgeon kdes
+    Each kde y on grid xs becomes v = sqrt(y * w) with trapezoid weights w,
+    so every v has unit length and ||v_i - v_j||^2 / 2 is the squared
+    Hellinger distance between kdes i and j.  Sign random projections of
+    the vectors, centred on their mean as kdes are all non-negative, hash
+    them into num_tables tables of num_bits bit keys.  A query ranks
+    the union of its buckets in every table exactly.
+    '''
+
+    def __init__(self, names, vectors, num_tables=8, num_bits=16, seed=42):
+        self.names = list(names)
+        self.lookup = {name: k for k, name in enumerate(self.names)}
+        self.vectors = np.asarray(vectors, dtype=np.float32)
+        self.center = self.vectors.mean(axis=0)
+
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((num_tables, num_bits, self.vectors.shape[1]),
+                                          dtype=np.float32)
+
+        keys = np.stack([self._keys(self.vectors, t) for t in range(num_tables)])
+        self.orders = np.argsort(keys, axis=1, kind='stable')
+        self.sorted_keys = np.take_along_axis(keys, self.orders, axis=1)
+
+    @classmethod
+    def from_densities(cls, names, xs, ys, **kwargs):
+        '''Build index from (U x grid) kdes on grid xs'''
+
+        weights = tt.trapezoid_weights(xs)
+
+        return cls(names, np.sqrt(np.maximum(ys, 0) * weights), **kwargs)
+
+    def _keys(self, vectors, t, block=2 ** 16):
+        '''Hash keys of vectors in table t'''
+
+        bits = 1 << np.arange(self.planes.shape[1], dtype=np.int64)
+        keys = np.empty(len(vectors), dtype=np.int64)
+
+        for start in range(0, len(vectors), block):
+            signs = (vectors[start:start + block] - self.center) @ self.planes[t].T > 0
+            keys[start:start + block] = signs @ bits
+
+        return keys
+
+    def candidates(self, vector):
+        '''Indices sharing the query's bucket in any table'''
+
+        found = []
+
+        for t in range(len(self.planes)):
+            key = self._keys(vector[None, :], t)[0]
+            lo = np.searchsorted(self.sorted_keys[t], key, side='left')
+            hi = np.searchsorted(self.sorted_keys[t], key, side='right')
+            found.append(self.orders[t][lo:hi])
+
+        return np.unique(np.concatenate(found))
+
+    def query(self, vector, k=5, exclude=None):
+        '''k approximate nearest neighbours of vector as (indices, hellinger)
+        Falls back to a linear scan when the buckets hold fewer than k.
+        '''
+
+        cands = self.candidates(vector)
+        cands = cands[cands != exclude]
+
+        if len(cands) < k:
+            cands = np.arange(len(self.names))
+            cands = cands[cands != exclude]
+
+        dists = np.sqrt(np.maximum(((self.vectors[cands] - vector) ** 2).sum(axis=1) / 2, 0))
+        best = np.argsort(dists, kind='stable')[:k]
+
+        return cands[best], dists[best]
+
+    def nearest(self, name, k=5):
+        '''Dataframe of the k surgeons with kdes closest to surgeon name'''
+
+        i = self.lookup[name]
+        idx, dists = self.query(self.vectors[i], k, exclude=i)
+
+        return pd.DataFrame({'surgeon': [self.names[j] for j in idx], 'hellinger': dists})
+
+    def save(self, filename):
+        '''Write index to npz file, replacing any previous index atomically'''
+
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, names=np.array(self.names, dtype=str), vectors=self.vectors,
+                     center=self.center, planes=self.planes, orders=self.orders,
+                     sorted_keys=self.sorted_keys)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''Read index written by save'''
+
+        index = cls.__new__(cls)
+
+        with np.load(filename) as data:
+            index.names = data['names'].tolist()
+            index.vectors = data['vectors']
+            index.center = data['center']
+            index.planes = data['planes']
+            index.orders = data['orders']
+            index.sorted_keys = data['sorted_keys']
+
+        index.lookup = {name: k for k, name in enumerate(index.names)}
+
+        return index
+
+
+def build_index(argv):
+    '''Build index from CSV, or from kdes in an incremental state file'''
+
+    if argv.state is not None:
+        state = tt.SimilarityState.load(argv.state)
+        names, xs, ys = state.names, state.xs, state.ys
+    else:
+        df = tt.read_notifications(argv.filename)
+        df[argv.feature] = tt.FEATURE_TRANSFORMERS[argv.feature](df['secs'])
+        bw_median = tt.kde_bandwidth(df, argv.feature, argv.bw_method, verbose=argv.verbose)
+
+        xs = tt.feature_grid(argv.feature)
+        values, offsets = tt.group_observations(df, argv.feature)
+        ys = tt.get_densities_arrays(values, offsets, argv.feature, bw_median, xs, argv.kde_engine)
+        names = ['user' + str(i) for i in range(len(ys))]
+
+    index = DensityIndex.from_densities(names, xs, ys, num_tables=argv.tables,
+                                        num_bits=argv.bits, seed=argv.seed)
+    index.save(argv.index)
+
+    if argv.verbose:
+        print('Indexed %d surgeons in %s' % (len(names), argv.index))
+
+
+def query_index(argv):
+    '''Print nearest surgeons to argv.surgeon'''
+
+    index = DensityIndex.load(argv.index)
+
+    start = time.perf_counter()
+    nearest = index.nearest(argv.surgeon, argv.k)
+    elapsed = time.perf_counter() - start
+
+    print('\nSurgeons most similar to %s (Hellinger distance):\n' % argv.surgeon, nearest)
+
+    if argv.verbose:
+        print('\nQuery took %.3f ms' % (elapsed * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description='Nearest neighbour search over surgeon notification time kdes')
+    parser.add_argument('-v',  '--verbose',
+                        help='Print additional information - default=%(default)s',
+                        default=False, action="store_true")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build index from CSV or state file')
+    build_src = build.add_mutually_exclusive_group(required=True)
+    build_src.add_argument('-fn', '--filename',
+                           help='File name for CSV input', type=str)
+    build_src.add_argument('-st', '--state',
+                           help='State file from tech_test_q1.py --update', type=str)
+    build.add_argument('-ix', '--index',
+                       required=True,
+                       help='File name for index output', type=str)
+    build.add_argument('-ft', '--feature',
+                       help='Feature name - default=%(default)s',
+                       default='secs.circ', type=str,
+                       choices=['secs', 'secs.sin', 'secs.cos', 'secs.circ'])
+    build.add_argument('-bw', '--bw_method',
+                       help='Bandwidth method - default=%(default)s',
+                       default='bw_scott', type=str,
+                       choices=['bw_scott', 'bw_silverman', 'scott', 'silverman', 'cv_ls',
+                                'cv_ls_binned'])
+    build.add_argument('-ke', '--kde_engine',
+                       help='KDE engine, fft bins onto grid - default=%(default)s',
+                       default='fft', type=str,
+                       choices=['scipy', 'fft'])
+    build.add_argument('-nt', '--tables',
+                       help='Hash tables - default=%(default)s',
+                       default=8, type=tt.int_range(1, 64),
+                       metavar="[1, 64]")
+    build.add_argument('-nb', '--bits',
+                       help='Hash bits per table - default=%(default)s',
+                       default=16, type=tt.int_range(1, 62),
+                       metavar="[1, 62]")
+    build.add_argument('-s',  '--seed',
+                       help='Random projection seed - default=%(default)s',
+                       default=42, type=int)
+
+    query = subparsers.add_parser('query', help='Find surgeons nearest to a surgeon')
+    query.add_argument('-ix', '--index',
+                       required=True,
+                       help='File name for index input', type=str)
+    query.add_argument('-u',  '--surgeon',
+                       required=True,
+                       help='Surgeon name, e.g. user3', type=str)
+    query.add_argument('-k',  '--k',
+                       help='Number of neighbours - default=%(default)s',
+                       default=5, type=tt.int_range(1, 1000),
+                       metavar="[1, 1000]")
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_index(args)
+    else:
+        query_index(args)
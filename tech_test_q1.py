@@ -1,14 +1,16 @@
-import pprint
-import random
+import heapq
+import hashlib
+import os
+import time
+import contextlib
+import tracemalloc
 import argparse
 import multiprocessing
+from multiprocessing import shared_memory
 
+# pandas, scipy, statsmodels and sklearn are imported in the functions using
+# them, so --help, argument errors and workers only pay for what they use
 import numpy as np
-import pandas as pd
-import statsmodels.api as sm
-from sklearn.utils import resample
-from scipy.stats import gaussian_kde
-from statsmodels.nonparametric.bandwidths import bw_silverman, bw_scott
 
 
 # A population of U surgeons receive N notifications at specific times during the day.
@@ -24,11 +26,14 @@ from statsmodels.nonparametric.bandwidths import bw_silverman, bw_scott
 # users.
 
 
-pp = pprint.PrettyPrinter(depth=4)
+# Features holding angles on the 24h clock, estimated with a circular kde
+CIRCULAR_FEATURES = ['secs.circ']
 
-# Reduces variance in results but won't eliminate it :-(
-random.seed(42)
-np.random.seed(42)
+# Columns of bootstrap summary tables
+SUMMARY_COLUMNS = ['mean', 'std', 'min', '2.5%', '50%', '97.5%', 'max']
+
+# Per worker process state for the shared memory bootstrap
+_shared = {}
 
 
 def print_df_summary(df):
@@ -54,6 +59,114 @@ def print_df_summary(df):
     print("\n")
 
 
+def parse_notifications(buf, lookup):
+    '''Parse complete "surgeon,HH:MM:SS" lines in bytes buf
+    Times are read straight from the last 8 bytes of each line as digits.
+    Surgeon names are dictionary encoded, lookup maps name to code and is
+    extended with names not seen before.
+    Returns int32 arrays of surgeon codes and seconds of day.
+    '''
+
+    data = np.frombuffer(buf, dtype=np.uint8)
+    ends = np.flatnonzero(data == ord('\n'))
+    starts = np.concatenate([[0], ends[:-1] + 1])
+
+    # Strip carriage returns and skip blank lines
+    ends = ends - ((ends > starts) & (data[np.maximum(ends - 1, 0)] == ord('\r')))
+    keep = ends > starts
+    starts, ends = starts[keep], ends[keep]
+
+    lens = ends - starts - len(',HH:MM:SS')
+    ok = lens > 0
+    time_bytes = data[np.maximum(ends, 9)[:, None] - 8 + np.arange(8)].astype(np.int32)
+    digits = time_bytes[:, [0, 1, 3, 4, 6, 7]] - ord('0')
+
+    ok &= (data[np.maximum(ends - 9, 0)] == ord(',')) & \
+        (time_bytes[:, 2] == ord(':')) & (time_bytes[:, 5] == ord(':'))
+    ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    mins = digits[:, 2] * 10 + digits[:, 3]
+    secs = digits[:, 4] * 10 + digits[:, 5]
+    ok &= (hours < 24) & (mins < 60) & (secs < 60)
+
+    if not ok.all():
+        bad = np.flatnonzero(~ok)[0]
+        raise ValueError('Malformed notification line: %r' % buf[starts[bad]:ends[bad]])
+
+    # Pad names into fixed width byte strings for np.unique
+    width = lens.max() if len(lens) else 1
+    idx = starts[:, None] + np.arange(width)
+    raw = np.where(np.arange(width) < lens[:, None], data[np.minimum(idx, len(data) - 1)], 0)
+    names = np.ascontiguousarray(raw, dtype=np.uint8).view('S%d' % width).ravel()
+
+    uniq, inverse = np.unique(names, return_inverse=True)
+    chunk_codes = np.array([lookup.setdefault(name.decode(), len(lookup)) for name in uniq],
+                           dtype=np.int32)
+
+    return chunk_codes[inverse.ravel()], (hours * 3600 + mins * 60 + secs).astype(np.int32)
+
+
+def iter_notifications(filename, lookup, chunk_bytes=2 ** 24, offset=0):
+    '''Yield (codes, secs, end) for complete CSV lines from byte offset
+    Lines are parsed in chunks of chunk_bytes, see parse_notifications.
+    end is the byte offset just after the last complete line so far, an
+    unterminated last line is left for the caller.
+    '''
+
+    tail = b''
+
+    with open(filename, 'rb') as fh:
+        fh.seek(offset)
+        pos = offset
+
+        while True:
+            block = fh.read(chunk_bytes)
+            if not block:
+                break
+
+            pos += len(block)
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+
+            if cut:
+                chunk_codes, chunk_secs = parse_notifications(block[:cut], lookup)
+                yield chunk_codes, chunk_secs, pos - len(tail)
+
+
+def read_notifications(filename, chunk_bytes=2 ** 24):
+    '''Read surgeon notification CSV in chunks of chunk_bytes
+    Never holds per row Python strings, surgeons become a categorical and
+    notification times int32 seconds of day.
+    '''
+
+    import pandas as pd
+
+    lookup = {}
+    codes = [np.empty(0, dtype=np.int32)]
+    secs = [np.empty(0, dtype=np.int32)]
+    end = 0
+
+    for chunk_codes, chunk_secs, end in iter_notifications(filename, lookup, chunk_bytes):
+        codes.append(chunk_codes)
+        secs.append(chunk_secs)
+
+    with open(filename, 'rb') as fh:
+        fh.seek(end)
+        tail = fh.read()
+
+    if tail.strip():
+        chunk_codes, chunk_secs = parse_notifications(tail + b'\n', lookup)
+        codes.append(chunk_codes)
+        secs.append(chunk_secs)
+
+    df = pd.DataFrame({'surgeon': pd.Categorical.from_codes(np.concatenate(codes), list(lookup)),
+                       'secs': np.concatenate(secs)})
+
+    return df
+
+
 def sin_transformer(x, period=3600 * 24):
     '''Encode periodic features in non-monotonic way so no jump between
     first and last value of periodic range'''
@@ -66,33 +179,58 @@ def cos_transformer(x, period=3600 * 24):
     return np.cos(x / period * 2 * np.pi)
 
 
+def circular_transformer(x, period=3600 * 24):
+    '''Map periodic feature onto angle in [0, 2*pi) so 06:00 and 18:00
+    remain distinct, unlike the sin or cos projections alone'''
+    return np.mod(x, period) / period * 2 * np.pi
+
+
+# Feature columns derived from seconds of day
+FEATURE_TRANSFORMERS = {'secs': np.asarray,
+                        'secs.sin': sin_transformer,
+                        'secs.cos': cos_transformer,
+                        'secs.circ': circular_transformer}
+
+
+def centre_angles(x):
+    '''Rotate angles to their circular mean and wrap to [-pi, pi)'''
+
+    x = np.asarray(x, dtype=float)
+    mean = np.angle(np.mean(np.exp(1j * x)))
+
+    return np.mod(x - mean + np.pi, 2 * np.pi) - np.pi
+
+
 def kde_bandwidth(df, feature, bw_method='scott', verbose=False):
     '''In order to compare the kde's, they need to be calculated with the
     same bandwidth.  The default bandwidth depends on the number of
     observations, which can be different for each surgeon.  Here I
-    calculate Scott's factor for each surgeon.  Then find the median of
-    these values.
+    calculate the bw_method bandwidth for each surgeon.  Then find the
+    median of these values.
+    Only the requested bw_method is computed.
+    Circular features are unwrapped around each surgeon's circular mean
+    first, see centre_angles.
     num_dims - number of dimensions (1 for univariate data)
     '''
 
-    # stastmodels
-    # https://github.com/statsmodels/statsmodels/blob/main/statsmodels/nonparametric/bandwidths.py
-    df_gb = df.groupby('surgeon').agg({feature: ['nunique', 'count', bw_scott, bw_silverman]})
-    df_gb.columns = ['nunique', 'count', 'bw_scott', 'bw_silverman']
+    df_gb = df.groupby('surgeon')[feature].agg(['nunique', 'count'])
 
-    # sklearn/scipy - bandwidths too wide
-    num_dims = df.shape[1]
-    df_gb['scott'] = df_gb['count'] ** (-1. / (num_dims + 4))
-    df_gb['silverman'] = (df_gb['count'] * (num_dims + 2) / 4) ** (-1. / (num_dims + 4))
-
-    # Note: bw='cv_ls' produces some very low estimates - NOT recommended
-    #       bw='cv_ml' produces some errors
-    sm_bws = []
-    for i in range(8):
-        df_i = df.loc[df['surgeon'] == 'user' + str(i), feature]
-        dens_u = sm.nonparametric.KDEMultivariate(data=df_i, var_type='c', bw='cv_ls')
-        sm_bws.append(dens_u.bw[0])
-    df_gb['cv_ls'] = sm_bws
+    if bw_method in ['scott', 'silverman']:
+        # sklearn/scipy - bandwidths too wide
+        num_dims = 1
+        if bw_method == 'scott':
+            df_gb['scott'] = df_gb['count'] ** (-1. / (num_dims + 4))
+        else:
+            df_gb['silverman'] = (df_gb['count'] * (num_dims + 2) / 4) ** (-1. / (num_dims + 4))
+    else:
+        # stastmodels
+        # https://github.com/statsmodels/statsmodels/blob/main/statsmodels/nonparametric/bandwidths.py
+        bw_func = BANDWIDTH_FUNCS[bw_method]
+        if feature in CIRCULAR_FEATURES:
+            # Linear selectors only see the spread of angles unwrapped
+            # around their circular mean, wherever they sit on the clock
+            bw_func = lambda x, func=bw_func: func(centre_angles(x))
+        df_gb[bw_method] = df.groupby('surgeon')[feature].agg(bw_func)
 
     if verbose:
         print('\n', feature)
@@ -101,12 +239,230 @@ def kde_bandwidth(df, feature, bw_method='scott', verbose=False):
     return np.median(df_gb[bw_method])
 
 
-def get_surgeon_data(df, i, feature, bandwidth=0.3, xs=np.linspace(-2, 2, 200)):
-    '''Get kernel density estimate for surgeon'''
+def bw_cv_ls(x):
+    '''Least squares cross-validation bandwidth with statsmodels, O(n^2)
+    Note: bw='cv_ls' produces some very low estimates - NOT recommended
+          bw='cv_ml' produces some errors
+    '''
+
+    from statsmodels.nonparametric.kernel_density import KDEMultivariate
+
+    dens_u = KDEMultivariate(data=x, var_type='c', bw='cv_ls')
+
+    return dens_u.bw[0]
+
+
+def bw_cv_ls_binned(x, num_bins=400, num_hs=100):
+    '''Binned least squares cross-validation bandwidth, O(num_bins^2)
+    Observations are linearly binned once.  The lag autocorrelation a of
+    the bin counts turns every pairwise kernel sum into a sum over lags,
+      sum_ij phi_s(x_i - x_j) ~ sum_lag a(lag) phi_s(lag * dx)
+    so each candidate bandwidth costs O(num_bins).  The LSCV criterion
+      int f^2 - 2/n sum_i f_{-i}(x_i)
+    is minimised over a log spaced grid of num_hs bandwidths, then refined.
+    Bandwidths below 2 bin widths are not considered, the binned kernel
+    sums are too coarse there.
+    '''
+
+    from scipy.optimize import minimize_scalar
+
+    x = np.asarray(x, dtype=float)
+    n = len(x)
+    spread = np.ptp(x)
+    if n < 2 or spread == 0:
+        return np.nan
+
+    dx = spread / (num_bins - 1)
+    counts = linear_binning(x, x.min(), dx, num_bins)
+    lags = np.arange(num_bins) * dx
+    autocorr = np.correlate(counts, counts, mode='full')[num_bins - 1:]
+    autocorr[1:] *= 2
+
+    def kernel_sum(s):
+        return autocorr @ np.exp(-0.5 * (lags / s) ** 2) / (s * np.sqrt(2 * np.pi))
+
+    def lscv(log_h):
+        h = np.exp(log_h)
+        loo = (kernel_sum(h) - n / (h * np.sqrt(2 * np.pi))) / (n * (n - 1))
+        return kernel_sum(h * np.sqrt(2)) / n ** 2 - 2 * loo
+
+    h_ref = 1.06 * x.std(ddof=1) * n ** (-1. / 5) if x.std(ddof=1) > 0 else spread
+    log_hs = np.linspace(np.log(max(h_ref / 100, 2 * dx)), np.log(h_ref * 2), num_hs)
+    best = np.argmin([lscv(log_h) for log_h in log_hs])
+
+    lo = log_hs[max(best - 1, 0)]
+    hi = log_hs[min(best + 1, num_hs - 1)]
+    res = minimize_scalar(lscv, bounds=(lo, hi), method='bounded')
+
+    return np.exp(res.x)
+
+
+def bw_scott(x):
+    '''Scott's rule of thumb bandwidth with statsmodels'''
+
+    from statsmodels.nonparametric.bandwidths import bw_scott as sm_bw_scott
+
+    return sm_bw_scott(x)
+
+
+def bw_silverman(x):
+    '''Silverman's rule of thumb bandwidth with statsmodels'''
+
+    from statsmodels.nonparametric.bandwidths import bw_silverman as sm_bw_silverman
+
+    return sm_bw_silverman(x)
+
+
+# Per surgeon bandwidth functions, see kde_bandwidth
+BANDWIDTH_FUNCS = {'bw_scott': bw_scott,
+                   'bw_silverman': bw_silverman,
+                   'cv_ls': bw_cv_ls,
+                   'cv_ls_binned': bw_cv_ls_binned}
+
+
+def linear_binning(data, x0, dx, num_bins, codes=None, num_codes=1):
+    '''Linearly bin observations onto uniform grid x0 + k*dx, k < num_bins
+    Each observation splits its unit weight between the two nearest grid
+    points.  Observations outside the grid are dropped.
+    With integer codes, returns (num_codes x num_bins) counts per code.
+    '''
+
+    pos = (np.asarray(data, dtype=float) - x0) / dx
+    keep = (pos >= 0) & (pos <= num_bins - 1)
+    pos = pos[keep]
+
+    left = np.minimum(np.floor(pos).astype(int), num_bins - 2)
+    frac = pos - left
+
+    if codes is not None:
+        left = left + np.asarray(codes)[keep] * num_bins
+
+    size = num_codes * num_bins
+    counts = np.bincount(left, weights=1 - frac, minlength=size)
+    counts += np.bincount(left + 1, weights=frac, minlength=size)
+
+    return counts if codes is None else counts.reshape(num_codes, num_bins)
+
+
+def circular_binning(data, num_bins, codes=None, num_codes=1):
+    '''Linearly bin angles onto periodic grid 2*pi*k/num_bins with wrap around
+    With integer codes, returns (num_codes x num_bins) counts per code.
+    '''
+
+    pos = np.mod(np.asarray(data, dtype=float), 2 * np.pi) / (2 * np.pi / num_bins)
+    left = np.floor(pos).astype(int)
+    frac = pos - left
+    left %= num_bins
+    right = (left + 1) % num_bins
+
+    if codes is not None:
+        left = left + np.asarray(codes) * num_bins
+        right = right + np.asarray(codes) * num_bins
+
+    size = num_codes * num_bins
+    counts = np.bincount(left, weights=1 - frac, minlength=size)
+    counts += np.bincount(right, weights=frac, minlength=size)
+
+    return counts if codes is None else counts.reshape(num_codes, num_bins)
+
+
+def fft_smooth(counts, h, dx):
+    '''Convolve binned counts with gaussian kernel of standard deviation h
+    The sampled kernel is normalised to unit mass, so mass is kept even
+    when h is below the bin width dx.
+    '''
+
+    from scipy.signal import fftconvolve
+
+    num_bins = len(counts)
+    offsets = np.arange(-(num_bins - 1), num_bins) * dx
+    kernel = np.exp(-0.5 * (offsets / h) ** 2)
+    kernel /= kernel.sum() * dx
+
+    return fftconvolve(counts, kernel, mode='same')
+
+
+def circular_smooth(counts, h):
+    '''Circularly convolve periodic binned counts with wrapped gaussian
+    kernel of standard deviation h radians, per unit bin width'''
+
+    num_bins = len(counts)
+    freqs = np.arange(num_bins // 2 + 1)
+    coefs = np.fft.rfft(counts) * np.exp(-0.5 * (freqs * h) ** 2)
+
+    return np.fft.irfft(coefs, n=num_bins)
+
+
+def kde_fft(data, bandwidth, xs):
+    '''Binned gaussian kde evaluated on uniform grid xs via FFT convolution
+    bandwidth is a factor of the sample standard deviation, as for
+    scipy.stats.gaussian_kde(bw_method=bandwidth).  The grid is padded by 4
+    kernel standard deviations (at most len(xs) points each side) so mass
+    just outside xs still contributes.  Only suitable for bounded features
+    like secs.sin and secs.cos.
+    '''
+
+    data = np.asarray(data, dtype=float)
+    h = bandwidth * data.std(ddof=1)
+    dx = xs[1] - xs[0]
+
+    pad = min(int(np.ceil(4 * h / dx)), len(xs))
+    num_bins = len(xs) + 2 * pad
+    counts = linear_binning(data, xs[0] - pad * dx, dx, num_bins)
+
+    dens = fft_smooth(counts, h, dx) / len(data)
+
+    return np.maximum(dens[pad:pad + len(xs)], 0)
+
+
+def kde_circular(data, bandwidth, xs):
+    '''Wrapped gaussian kde of angles evaluated on periodic grid xs
+    xs must be np.linspace(0, 2*pi, G + 1), the last point repeating the
+    first, so trapezoid integration over xs covers the whole circle.
+    bandwidth is a factor of the circular standard deviation sqrt(-2 ln R),
+    the circular analogue of gaussian_kde(bw_method=bandwidth).
+    Observations are linearly binned with wrap around and convolved in the
+    Fourier domain where the wrapped gaussian has coefficients exp(-k^2 h^2 / 2).
+    '''
+
+    data = np.asarray(data, dtype=float)
+    num_bins = len(xs) - 1
+    dx = 2 * np.pi / num_bins
+
+    res_len = np.abs(np.mean(np.exp(1j * data)))
+    h = bandwidth * np.sqrt(-2 * np.log(res_len))
+
+    counts = circular_binning(data, num_bins)
+    dens = np.maximum(circular_smooth(counts, h) / (len(data) * dx), 0)
+
+    return np.append(dens, dens[0])
+
+
+def get_surgeon_data(df, i, feature, bandwidth=0.3, xs=np.linspace(-2, 2, 200),
+                     kde_engine='scipy'):
+    '''Get kernel density estimate for surgeon
+    kde_engine - 'scipy' for exact gaussian_kde, 'fft' for binned FFT kde
+    Circular features always use the wrapped gaussian kde.
+    '''
 
     ser_i = df.loc[df['surgeon'] == 'user' + str(i), feature]
 
-    kde_i = gaussian_kde(ser_i, bw_method=bandwidth)
+    return kde_estimate(ser_i, feature, bandwidth, xs, kde_engine)
+
+
+def kde_estimate(data, feature, bandwidth, xs, kde_engine='scipy'):
+    '''Kernel density estimate of observations data on grid xs'''
+
+    if feature in CIRCULAR_FEATURES:
+        return kde_circular(data, bandwidth, xs)
+
+    if kde_engine == 'fft':
+        return kde_fft(data, bandwidth, xs)
+
+    # Only the exact engine needs scipy.stats, the slowest import here
+    from scipy.stats import gaussian_kde
+
+    kde_i = gaussian_kde(data, bw_method=bandwidth)
     y_i = kde_i(xs)
 
     return y_i
@@ -121,21 +477,233 @@ def kde_intersection(xs, y_i, y_j):
     return area_inters_y * 100
 
 
+def trapezoid_weights(xs):
+    '''Quadrature weights so that ys @ weights == np.trapz(ys, xs)'''
+
+    dx = np.diff(xs)
+    weights = np.zeros(len(xs))
+    weights[:-1] += dx / 2
+    weights[1:] += dx / 2
+
+    return weights
+
+
+def pairwise_min_sums(ys, weights, block_elems=2 ** 22):
+    '''Weighted sum of np.minimum over all pairs of rows of ys
+    Pairs i < j are processed in blocks of rows so at most block_elems
+    intermediate values are held at once.  Result is a condensed array with
+    the same layout as scipy.spatial.distance.pdist:
+      index(i, j) = U*i - i*(i+1)/2 + j - i - 1
+    '''
+
+    num_surgs, grid = ys.shape
+    sums = np.empty(num_surgs * (num_surgs - 1) // 2)
+
+    block = max(1, block_elems // max(1, num_surgs * grid))
+    start = 0
+
+    for a in range(0, num_surgs - 1, block):
+        b = min(a + block, num_surgs - 1)
+        # Rows a..b-1 against all rows after a
+        areas = np.minimum(ys[a:b, None, :], ys[None, a + 1:, :]) @ weights
+
+        for i in range(a, b):
+            row = areas[i - a, i - a:]
+            sums[start:start + len(row)] = row
+            start += len(row)
+
+    return sums
+
+
+def kde_intersections(xs, ys, block_elems=2 ** 22):
+    '''Percent overlap between all pairs of kdes in (U x grid) array ys
+    Returns condensed array, see pairwise_min_sums.
+    '''
+
+    inters = pairwise_min_sums(ys, trapezoid_weights(xs), block_elems)
+
+    return np.round(inters * 100, 6)
+
+
+def pair_indices(num_surgs):
+    '''Surgeon indices (i, j) matching condensed similarity array layout'''
+
+    return np.triu_indices(num_surgs, k=1)
+
+
+def condensed_index(i, j, num_surgs):
+    '''Position of pairs i < j in condensed array'''
+
+    return num_surgs * i - i * (i + 1) // 2 + j - i - 1
+
+
+def condensed_to_pairs(idx, num_surgs):
+    '''Surgeon indices (i, j) for positions idx in condensed array'''
+
+    idx = np.asarray(idx, dtype=np.int64)
+    n = num_surgs
+
+    i = n - 2 - np.floor(np.sqrt(-8 * idx + 4 * n * (n - 1) - 7) / 2 - 0.5).astype(np.int64)
+    j = idx + i + 1 - n * (n - 1) // 2 + (n - i) * (n - i - 1) // 2
+
+    return i, j
+
+
+def lsh_seed_pairs(vectors, num_tables=4, num_bits=16, window=4, seed=42):
+    '''Cheap candidate pairs (i < j) of similar rows of vectors
+    Rows are hashed with mean-centred sign random projections, as in
+    surgeon_index.DensityIndex, and each row is paired with the next window
+    rows in hash key order of every table.  Rows with equal or nearby keys
+    point the same way, so the pairs are mostly near neighbours.
+    Returns sorted unique condensed indices, about U * window * num_tables.
+    '''
+
+    num_surgs = len(vectors)
+    centred = vectors - vectors.mean(axis=0)
+    bits = 1 << np.arange(num_bits, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    pairs = []
+
+    for _ in range(num_tables):
+        planes = rng.standard_normal((num_bits, vectors.shape[1]))
+        order = np.argsort((centred @ planes.T > 0) @ bits, kind='stable')
+
+        for offset in range(1, min(window, num_surgs - 1) + 1):
+            i, j = order[:-offset], order[offset:]
+            pairs.append(condensed_index(np.minimum(i, j), np.maximum(i, j), num_surgs))
+
+    return np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.int64)
+
+
+def top_k_pairs(xs, ys, k, num_bins=10, block_elems=2 ** 22, chunk=4096):
+    '''Find the k pairs with largest percent overlap without scoring every pair
+    The trapezoid mass of each kde is pooled into num_bins coarse bins.  The
+    sum of min(coarse masses) is an upper bound on the overlap.  A threshold
+    is seeded by scoring the lsh_seed_pairs exactly.  Bounds are then made
+    one block of rows at a time and only pairs whose bound beats the k-th
+    best overlap so far are scored exactly, raising the threshold as better
+    pairs are found.  No all-pairs array is ever made or sorted.
+    Returns (i, j, overlap) arrays sorted by decreasing overlap.
+    '''
+
+    num_surgs = len(ys)
+    k = min(k, num_surgs * (num_surgs - 1) // 2)
+    weights = trapezoid_weights(xs)
+
+    # Coarse masses in percent, bins x surgeons so each bin is contiguous
+    bin_starts = np.linspace(0, len(xs), num_bins, endpoint=False).astype(int)
+    masses = np.add.reduceat(ys * weights, bin_starts, axis=1).T * 100
+    masses = np.ascontiguousarray(masses, dtype=np.float32)
+
+    heap = []
+
+    def score(idx):
+        '''Score condensed indices exactly into heap, return new threshold'''
+
+        for start in range(0, len(idx), chunk):
+            cands = idx[start:start + chunk]
+            i, j = condensed_to_pairs(cands, num_surgs)
+            inters = np.round(np.minimum(ys[i], ys[j]) @ weights * 100, 6)
+
+            for inter, c in zip(inters.tolist(), cands.tolist()):
+                if len(heap) < k:
+                    heapq.heappush(heap, (inter, c))
+                elif inter > heap[0][0]:
+                    heapq.heapreplace(heap, (inter, c))
+
+        # Slack covers float32 bounds and overlaps rounded to 6 decimals
+        return heap[0][0] - 1e-4 if heap and len(heap) == k else -np.inf
+
+    seeds = lsh_seed_pairs(np.sqrt(np.maximum(ys, 0) * weights))
+    threshold = score(seeds)
+
+    rows = max(1, block_elems // num_surgs)
+
+    for a in range(0, num_surgs - 1, rows):
+        b = min(a + rows, num_surgs - 1)
+
+        # Bounds of rows a..b-1 against every later row, one bin at a time
+        bounds = np.zeros((b - a, num_surgs - a - 1), dtype=np.float32)
+        mins = np.empty_like(bounds)
+        for row in masses:
+            np.minimum(row[a:b, None], row[None, a + 1:], out=mins)
+            bounds += mins
+        bounds[np.tril_indices(b - a, -1, bounds.shape[1])] = -np.inf
+
+        ii, jj = np.nonzero(bounds > threshold)
+        if len(ii) == 0:
+            continue
+
+        # Best bounds first, so the threshold rises before weak pairs are met
+        cand_bounds = bounds[ii, jj]
+        order = np.argsort(-cand_bounds, kind='stable')
+        cand_bounds = cand_bounds[order]
+        idx = condensed_index(ii[order] + a, jj[order] + a + 1, num_surgs)
+        # Seeds are sorted and already scored
+        pos = np.minimum(np.searchsorted(seeds, idx), max(len(seeds) - 1, 0))
+        fresh = seeds[pos] != idx if len(seeds) else np.ones(len(idx), dtype=bool)
+        idx, cand_bounds = idx[fresh], cand_bounds[fresh]
+
+        for start in range(0, len(idx), chunk):
+            if cand_bounds[start] <= threshold:
+                break
+            live = cand_bounds[start:start + chunk] > threshold
+            threshold = score(idx[start:start + chunk][live])
+
+    best = sorted(heap, reverse=True)
+    i, j = condensed_to_pairs([c for _, c in best], num_surgs)
+
+    return i, j, np.array([inter for inter, _ in best])
+
+
+def subset_surgeons(df, surgeons):
+    '''Rows for surgeons, relabelled user0..userN in order of surgeons'''
+
+    labels = {'user' + str(s): 'user' + str(n) for n, s in enumerate(surgeons)}
+    df_sub = df.loc[df['surgeon'].isin(labels.keys())].copy()
+    df_sub['surgeon'] = df_sub['surgeon'].astype(str).map(labels)
+
+    return df_sub
+
+
 def get_xs(xmin, xmax, n):
     '''Get x values used with kernel density estimates'''
 
     return np.linspace(xmin, xmax, n)
 
 
-def bootstrap_sample(df):
+def feature_grid(feature):
+    '''Get x values used with kernel density estimates of feature'''
+
+    if feature in CIRCULAR_FEATURES:
+        # Periodic grid, last point repeats first
+        return get_xs(0, 2 * np.pi, 201)
+
+    return get_xs(-2, 2, 200)
+
+
+def replicate_seed(seed, i):
+    '''SeedSequence for bootstrap replicate i
+    Child i of SeedSequence(seed), derived directly so replicate streams do
+    not depend on worker count, chunking or which machine runs them.
+    '''
+
+    return np.random.SeedSequence(seed, spawn_key=(i,))
+
+
+def bootstrap_sample(df, random_state=None):
     '''Resample data for bootstrap analysis'''
 
+    import pandas as pd
+    from sklearn.utils import resample
+
     strata_samples = []
     num_surgs = df['surgeon'].nunique()
 
     for i in range(num_surgs):
         X = df.loc[df['surgeon'] == 'user' + str(i), :]
-        strata_sample = resample(X, n_samples=X.shape[0], replace=True)
+        strata_sample = resample(X, n_samples=X.shape[0], replace=True,
+                                 random_state=random_state)
         strata_samples.append(strata_sample)
 
     df_sample = pd.concat(strata_samples)
@@ -143,88 +711,964 @@ def bootstrap_sample(df):
     return df_sample
 
 
-def _inner_bootstrap(df, feature, bw_median, xs, i):
+def group_observations(df, feature):
+    '''Group feature values by surgeon into one contiguous array
+    Observations for surgeon i are values[offsets[i]:offsets[i + 1]].
+    Done once so bootstrap replicates avoid rescanning the dataframe.
+    '''
+
+    surgeon = df['surgeon'].astype('category')
+    numbers = surgeon.cat.categories.str[len('user'):].astype(int).to_numpy()
+    codes = numbers[surgeon.cat.codes.to_numpy()]
+    order = np.argsort(codes, kind='stable')
+
+    values = df[feature].to_numpy(dtype=float)[order]
+    counts = np.bincount(codes)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    return values, offsets
+
+
+def bootstrap_indices(offsets, rng):
+    '''Stratified bootstrap indices for one replicate
+    Draws all surgeons with one RNG call.  Returns length N array which
+    resamples each surgeon's observations within that surgeon's offsets,
+    so values[idx] keeps the same grouping as values.
+    '''
+
+    counts = np.diff(offsets)
+    starts = np.repeat(offsets[:-1], counts)
+    sizes = np.repeat(counts, counts)
+
+    draws = rng.random(len(starts))
+
+    return starts + (draws * sizes).astype(np.int64)
+
+
+def get_densities_arrays(values, offsets, feature, bw_median, xs, kde_engine='scipy'):
+    '''Stack kernel density estimates of grouped observations into (U x grid) array'''
+
+    ys = np.empty((len(offsets) - 1, len(xs)))
+
+    for i in range(len(offsets) - 1):
+        ys[i] = kde_estimate(values[offsets[i]:offsets[i + 1]], feature, bw_median,
+                             xs, kde_engine)
+
+    return ys
+
+
+def get_similarities_arrays(values, offsets, feature, bw_median, xs, kde_engine='scipy'):
+    '''Calculate similarities between surgeons from grouped observations'''
+
+    ys = get_densities_arrays(values, offsets, feature, bw_median, xs, kde_engine)
+
+    return kde_intersections(xs, ys)
+
+
+def _inner_bootstrap_batch(values, offsets, feature, bw_median, xs, kde_engine,
+                           seed, start, num_reps):
+    '''Bootstrap replicates start..start+num_reps on grouped arrays'''
+
+    sims = []
+
+    for i in range(start, start + num_reps):
+        rng = np.random.default_rng(replicate_seed(seed, i))
+        idx = bootstrap_indices(offsets, rng)
+        sims.append(get_similarities_arrays(values[idx], offsets, feature, bw_median, xs,
+                                            kde_engine))
+
+    return np.vstack(sims)
+
+
+def _inner_bootstrap(df, feature, bw_median, xs, kde_engine, seed, i):
     '''Bootstrap function for multiprocessing'''
 
-    df_sample = bootstrap_sample(df)
-    sim = get_similarities(df_sample, feature, bw_median, xs)
-    sim['sample'] = i
+    random_state = np.random.RandomState(np.random.MT19937(replicate_seed(seed, i)))
+    df_sample = bootstrap_sample(df, random_state)
+    sim = get_similarities(df_sample, feature, bw_median, xs, kde_engine)
 
     return sim
 
 
-def bootstrap_similarities(df, bw_median, xs, argv):
-    '''Run bootstrap analysis'''
+def _init_shared_worker(values_name, num_values, offsets, feature, bw_median, xs,
+                        kde_engine, seed, result_name=None, result_shape=None):
+    '''Attach worker process to shared observation and, optionally, result arrays'''
+
+    values_shm = shared_memory.SharedMemory(name=values_name)
+
+    _shared['shms'] = [values_shm]
+    _shared['values'] = np.ndarray((num_values,), dtype=float, buffer=values_shm.buf)
+    _shared['args'] = (offsets, feature, bw_median, xs, kde_engine, seed)
+
+    if result_name is not None:
+        result_shm = shared_memory.SharedMemory(name=result_name)
+        _shared['shms'].append(result_shm)
+        _shared['result'] = np.ndarray(result_shape, dtype=float, buffer=result_shm.buf)
+
+
+def _shared_bootstrap_batch(start, num_reps):
+    '''Bootstrap replicates start..start+num_reps from shared observations
+    Written into the shared result array if there is one, otherwise returned.
+    '''
+
+    offsets, feature, bw_median, xs, kde_engine, seed = _shared['args']
+    sims = _inner_bootstrap_batch(_shared['values'], offsets, feature, bw_median, xs,
+                                  kde_engine, seed, start, num_reps)
+
+    if 'result' not in _shared:
+        return sims
+
+    _shared['result'][start:start + num_reps] = sims
+
+    return None
+
+
+def _shared_bootstrap_task(task):
+    '''Unpack (start, num_reps) task for Pool.imap'''
+
+    return _shared_bootstrap_batch(*task)
+
+
+def _inner_bootstrap_task(args):
+    '''Unpack _inner_bootstrap arguments for Pool.imap'''
+
+    return _inner_bootstrap(*args)
+
+
+def bootstrap_tasks(samples, num_values, num_workers, chunk_size=None):
+    '''Split bootstrap replicates into (start, num_reps) tasks'''
+
+    # Bound (batch x N) index array, but give every worker some batches
+    batch_size = chunk_size or max(1, min(-(-samples // num_workers), 2 ** 22 // num_values))
+
+    return [(start, min(batch_size, samples - start)) for start in range(0, samples, batch_size)]
+
+
+def shared_bootstrap(values, offsets, feature, bw_median, xs, kde_engine, seed, tasks,
+                     samples, num_workers):
+    '''Run bootstrap batches in a worker pool using shared memory
+    Observations are copied once into shared memory, workers receive only
+    replicate ranges (start, num_reps) and write into a preallocated shared
+    (samples x pairs) result array.
+    '''
+
+    num_surgs = len(offsets) - 1
+    result_shape = (samples, num_surgs * (num_surgs - 1) // 2)
+
+    values_shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+    result_shm = shared_memory.SharedMemory(create=True,
+                                            size=max(1, 8 * result_shape[0] * result_shape[1]))
+
+    try:
+        np.ndarray(values.shape, dtype=float, buffer=values_shm.buf)[:] = values
+        initargs = (values_shm.name, len(values), offsets, feature, bw_median, xs,
+                    kde_engine, seed, result_shm.name, result_shape)
+
+        with multiprocessing.Pool(num_workers, initializer=_init_shared_worker,
+                                  initargs=initargs) as pool:
+            pool.starmap(_shared_bootstrap_batch, tasks)
+
+        bs_sims = np.ndarray(result_shape, dtype=float, buffer=result_shm.buf).copy()
+    finally:
+        values_shm.close()
+        values_shm.unlink()
+        result_shm.close()
+        result_shm.unlink()
+
+    return bs_sims
+
+
+def iter_shared_bootstrap(values, offsets, feature, bw_median, xs, kde_engine, seed, tasks,
+                          num_workers):
+    '''Yield (num_reps x pairs) bootstrap batches in replicate order from a
+    shared memory worker pool, without holding every replicate at once'''
+
+    values_shm = shared_memory.SharedMemory(create=True, size=max(1, values.nbytes))
+
+    try:
+        np.ndarray(values.shape, dtype=float, buffer=values_shm.buf)[:] = values
+        initargs = (values_shm.name, len(values), offsets, feature, bw_median, xs,
+                    kde_engine, seed)
+
+        with multiprocessing.Pool(num_workers, initializer=_init_shared_worker,
+                                  initargs=initargs) as pool:
+            yield from pool.imap(_shared_bootstrap_task, tasks)
+    finally:
+        values_shm.close()
+        values_shm.unlink()
+
+
+def iter_bootstrap_similarities(df, bw_median, xs, argv, default_chunk=None, start=0):
+    '''Yield bootstrap similarities as (batch x pairs) arrays in replicate order
+    default_chunk - samples per batch when --chunk_size is not given
+    start - first replicate, earlier replicates are skipped
+    '''
 
     feature = argv.feature
+    kde_engine = argv.kde_engine
     samples = argv.samples
-    verbose = argv.verbose
-    sims = []
+    num_workers = argv.workers
+    chunk_size = argv.chunk_size or default_chunk
+    seed = argv.seed
+
+    if argv.bootstrap_engine == 'arrays':
+        values, offsets = group_observations(df, feature)
+        tasks = [(start + first, num_reps) for first, num_reps in
+                 bootstrap_tasks(samples - start, len(values), num_workers, chunk_size)]
+
+        if num_workers > 1:
+            yield from iter_shared_bootstrap(values, offsets, feature, bw_median, xs,
+                                             kde_engine, seed, tasks, num_workers)
+        else:
+            for start, num_reps in tasks:
+                yield _inner_bootstrap_batch(values, offsets, feature, bw_median, xs,
+                                             kde_engine, seed, start, num_reps)
+    elif num_workers > 1:
+        arg_iterable = [(df, feature, bw_median, xs, kde_engine, seed, sample)
+                        for sample in range(start, samples)]
+        with multiprocessing.Pool(num_workers) as pool:
+            for sim in pool.imap(_inner_bootstrap_task, arg_iterable, chunksize=chunk_size or 1):
+                yield sim[None, :]
+    else:
+        for i in range(start, samples):
+            yield _inner_bootstrap(df, feature, bw_median, xs, kde_engine, seed, i)[None, :]
 
-    num_cores = multiprocessing.cpu_count()
 
-    if verbose:
-        print('\nRunning bootstrap(samples=%d) using %d cores' % (samples, num_cores))
+def iter_cached_similarities(df, bw_median, xs, argv, cache=None, default_chunk=None):
+    '''Yield bootstrap similarities like iter_bootstrap_similarities, reusing
+    replicates from cache
+    Replicate i depends only on the seed and i, so cached replicates are
+    yielded first and only the missing ones are run.  New replicates are
+    appended to the cache, also when the caller stops early.
+    '''
 
-    if num_cores > 1:
-        arg_iterable = [(df, feature, bw_median, xs, sample) for sample in range(samples)]
-        with multiprocessing.Pool(num_cores) as pool:
-            sims = pool.starmap(_inner_bootstrap, arg_iterable)
-    else:
-        for i in range(samples):
-            sim = _inner_bootstrap(df, feature, bw_median, xs, i)
-            sims.append(sim)
+    if cache is None:
+        yield from iter_bootstrap_similarities(df, bw_median, xs, argv, default_chunk)
+        return
 
-    bs_sims = pd.concat(sims)
+    params = {'feature': argv.feature, 'bw_median': float(bw_median),
+              'kde_engine': argv.kde_engine, 'bootstrap_engine': argv.bootstrap_engine,
+              'seed': argv.seed}
+    entry = cache.get('replicates', **params)
+    cached = entry['sims'] if entry is not None else None
+    num_cached = min(len(cached), argv.samples) if cached is not None else 0
+
+    if argv.verbose:
+        print('\nReusing %d cached bootstrap samples' % num_cached)
+
+    batch = argv.chunk_size or default_chunk or max(num_cached, 1)
+    for first in range(0, num_cached, batch):
+        yield cached[first:min(first + batch, num_cached)]
+
+    fresh = []
+    try:
+        for sims in iter_bootstrap_similarities(df, bw_median, xs, argv, default_chunk,
+                                                start=num_cached):
+            fresh.append(sims)
+            yield sims
+    finally:
+        if fresh:
+            previous = [cached[:num_cached]] if num_cached else []
+            cache.put('replicates', {'sims': np.vstack(previous + fresh)}, **params)
+
+
+def bootstrap_similarities(df, bw_median, xs, argv, cache=None):
+    '''Run bootstrap analysis'''
+
+    if argv.verbose:
+        print('\nRunning bootstrap(samples=%d) using %d workers' % (argv.samples, argv.workers))
+
+    if cache is None and argv.bootstrap_engine == 'arrays' and argv.workers > 1:
+        values, offsets = group_observations(df, argv.feature)
+        tasks = bootstrap_tasks(argv.samples, len(values), argv.workers, argv.chunk_size)
+
+        return shared_bootstrap(values, offsets, argv.feature, bw_median, xs, argv.kde_engine,
+                                argv.seed, tasks, argv.samples, argv.workers)
+
+    # (samples x pairs) array
+    bs_sims = np.vstack(list(iter_cached_similarities(df, bw_median, xs, argv, cache)))
 
     return bs_sims
 
 
-def summarise_similarities(sims, feature):
-    '''Summarise bootstrap similarities'''
+def stream_similarities(df, bw_median, xs, argv, cache=None):
+    '''Run bootstrap analysis, summarising replicates as they finish'''
+
+    if argv.verbose:
+        print('\nStreaming bootstrap(samples=%d) using %d workers' % (argv.samples, argv.workers))
+
+    num_surgs = df['surgeon'].nunique()
+    summary = StreamingSummary(num_surgs * (num_surgs - 1) // 2)
+
+    for sims in iter_cached_similarities(df, bw_median, xs, argv, cache):
+        summary.update(sims)
+
+    return summary
+
+
+def sequential_similarities(df, bw_median, xs, argv, min_samples=100, batch=25, cache=None):
+    '''Run bootstrap analysis in batches until the most similar pair is settled
+    After each batch, once min_samples replicates are in, stop if the lower
+    confidence limit of the pair with the highest mean exceeds the upper
+    limit of the runner-up at confidence argv.early_stop.
+    '''
+
+    if argv.verbose:
+        print('\nSequential bootstrap(samples<=%d, confidence=%g) using %d workers'
+              % (argv.samples, argv.early_stop, argv.workers))
+
+    alpha = 100 * (1 - argv.early_stop) / 2
+    limits = ['%g%%' % alpha, '%g%%' % (100 - alpha)]
+    percentiles = sorted({2.5, 50, 97.5, alpha, 100 - alpha})
+
+    num_surgs = df['surgeon'].nunique()
+    summary = StreamingSummary(num_surgs * (num_surgs - 1) // 2, percentiles)
+    min_samples = min(min_samples, argv.samples)
+
+    for sims in iter_cached_similarities(df, bw_median, xs, argv, cache, default_chunk=batch):
+        summary.update(sims)
+
+        if summary.count < min_samples or len(summary.mean) < 2:
+            continue
+
+        quantiles = dict(zip(['%g%%' % p for p in percentiles], summary.quantiles()))
+        top, runner_up = np.argsort(-summary.mean, kind='stable')[:2]
+
+        if quantiles[limits[0]][top] > quantiles[limits[1]][runner_up]:
+            break
 
-    sims_gb = sims.groupby(['i', 'j'])[feature].describe(percentiles=[0.025, 0.975])
-    sims_gb.drop('count', axis=1, inplace=True)
+    return summary
+
+
+class StreamingSummary:
+    '''Running per-pair bootstrap summary in O(pairs) memory
+    Mean and std use Welford/Chan updates, min and max are exact and the
+    percentiles use the P^2 algorithm (Jain & Chlamtac 1985) with five
+    markers per pair and percentile.
+    '''
+
+    def __init__(self, num_pairs, percentiles=(2.5, 50, 97.5)):
+        self.percentiles = list(percentiles)
+        self.count = 0
+        self.mean = np.zeros(num_pairs)
+        self.m2 = np.zeros(num_pairs)
+        self.min = np.full(num_pairs, np.inf)
+        self.max = np.full(num_pairs, -np.inf)
+
+        # P^2 markers: heights q and positions n are (percentiles x 5 x pairs)
+        probs = np.asarray(percentiles, dtype=float)[:, None] / 100
+        ones = np.ones_like(probs)
+        self.first = []
+        self.q = None
+        self.n = None
+        self.desired = np.hstack([ones, 1 + 2 * probs, 1 + 4 * probs, 3 + 2 * probs, 5 * ones])
+        self.incr = np.hstack([0 * probs, probs / 2, probs, (1 + probs) / 2, ones])
+
+    def update(self, sims):
+        '''Add (batch x pairs) array of replicate similarities'''
+
+        sims = np.atleast_2d(sims)
+        num_reps = len(sims)
+
+        batch_mean = sims.mean(axis=0)
+        batch_m2 = ((sims - batch_mean) ** 2).sum(axis=0)
+        delta = batch_mean - self.mean
+        total = self.count + num_reps
+
+        self.mean += delta * num_reps / total
+        self.m2 += batch_m2 + delta ** 2 * self.count * num_reps / total
+        self.count = total
+
+        self.min = np.minimum(self.min, sims.min(axis=0))
+        self.max = np.maximum(self.max, sims.max(axis=0))
+
+        for row in sims:
+            self._update_markers(row)
+
+    def _update_markers(self, x):
+        '''P^2 update of every percentile marker with one replicate x'''
+
+        if self.q is None:
+            self.first.append(x)
+            if len(self.first) == 5:
+                first = np.sort(self.first, axis=0)
+                self.q = np.repeat(first[None], len(self.percentiles), axis=0)
+                self.n = np.broadcast_to(np.arange(1., 6.)[None, :, None], self.q.shape).copy()
+                self.first = []
+            return
+
+        q, n = self.q, self.n
+        q[:, 0] = np.minimum(q[:, 0], x)
+        q[:, 4] = np.maximum(q[:, 4], x)
+
+        # Cell containing x, markers above it move up one position
+        cell = (x >= q[:, 1:4]).sum(axis=1)
+        n += np.arange(5)[None, :, None] > cell[:, None, :]
+        self.desired += self.incr
+
+        for i in (1, 2, 3):
+            d = self.desired[:, i, None] - n[:, i]
+            up = (d >= 1) & (n[:, i + 1] - n[:, i] > 1)
+            down = (d <= -1) & (n[:, i - 1] - n[:, i] < -1)
+            move = up | down
+            if not move.any():
+                continue
+
+            step = np.where(up, 1., -1.)
+            parabolic = q[:, i] + step / (n[:, i + 1] - n[:, i - 1]) * (
+                (n[:, i] - n[:, i - 1] + step) * (q[:, i + 1] - q[:, i]) / (n[:, i + 1] - n[:, i])
+                + (n[:, i + 1] - n[:, i] - step) * (q[:, i] - q[:, i - 1]) / (n[:, i] - n[:, i - 1]))
+            linear = q[:, i] + step * (np.where(up, q[:, i + 1], q[:, i - 1]) - q[:, i]) \
+                / (np.where(up, n[:, i + 1], n[:, i - 1]) - n[:, i])
+            inside = (q[:, i - 1] < parabolic) & (parabolic < q[:, i + 1])
+
+            q[:, i] = np.where(move, np.where(inside, parabolic, linear), q[:, i])
+            n[:, i] += np.where(move, step, 0)
+
+    def quantiles(self):
+        '''Current (percentiles x pairs) percentile estimates'''
+
+        if self.q is None:
+            return np.percentile(self.first, self.percentiles, axis=0)
+
+        return self.q[:, 2].copy()
+
+    def summarise(self, num_surgs):
+        '''Summary table with the same columns as summarise_similarities'''
+
+        pcts = self.quantiles()
+        stats = {'mean': self.mean,
+                 'std': np.sqrt(self.m2 / max(self.count - 1, 1)),
+                 'min': self.min}
+        stats.update({'%g%%' % pct: pcts[k] for k, pct in enumerate(self.percentiles)})
+        stats['max'] = self.max
+
+        return similarity_table(stats, num_surgs)
+
+
+def similarity_table(stats, num_surgs):
+    '''Per-pair summary statistics as dataframe indexed by (i, j), sorted by mean'''
+
+    import pandas as pd
+
+    i, j = pair_indices(num_surgs)
+    sims_gb = pd.DataFrame(stats, index=pd.MultiIndex.from_arrays([i, j], names=['i', 'j']))
 
     return sims_gb.sort_values('mean', ascending=False)
 
 
-def get_similarities(df, feature, bw_median, xs):
-    '''Calculate similarities between surgeons'''
+def summarise_similarities(sims, num_surgs):
+    '''Summarise bootstrap similarities
+    sims - (samples x pairs) array of condensed similarities
+    '''
+
+    pcts = np.percentile(sims, [2.5, 50, 97.5], axis=0)
+
+    stats = {'mean': sims.mean(axis=0),
+             'std': sims.std(axis=0, ddof=1),
+             'min': sims.min(axis=0),
+             '2.5%': pcts[0],
+             '50%': pcts[1],
+             '97.5%': pcts[2],
+             'max': sims.max(axis=0)}
+
+    return similarity_table(stats, num_surgs)
+
+
+def top_k_similarities(df, bw_median, xs, argv, cache=None, profiler=None):
+    '''Bootstrap only the top k pairs on the point estimate'''
+
+    import pandas as pd
+
+    profiler = profiler or StageProfiler(enabled=False)
+
+    with profiler.stage('get_surgeon_data'):
+        ys = cached_densities(df, argv.feature, bw_median, xs, argv.kde_engine, cache)
+
+    with profiler.stage('kde_intersections'):
+        top_i, top_j, top_inters = top_k_pairs(xs, ys, argv.top_k)
+
+    if argv.verbose:
+        print('\nTop %d pairs on point estimate:' % len(top_inters))
+        for i, j, inter in zip(top_i, top_j, top_inters):
+            print('  user%d user%d %.6f' % (i, j, inter))
+
+    finalists = np.union1d(top_i, top_j)
+    if cache is not None:
+        cache = cache.scoped(surgeons=finalists.tolist())
+    sims_sum = bootstrap_summary(subset_surgeons(df, finalists), bw_median, xs, argv, cache,
+                                 profiler)
+
+    # Back to original surgeon numbers, keeping only top k pairs
+    sims_sum.index = pd.MultiIndex.from_arrays(
+        [finalists[sims_sum.index.get_level_values(level)] for level in ['i', 'j']],
+        names=['i', 'j'])
+    top = pd.MultiIndex.from_arrays([top_i, top_j], names=['i', 'j'])
+
+    return sims_sum.loc[sims_sum.index.isin(top)]
+
+
+def bootstrap_summary(df, bw_median, xs, argv, cache=None, profiler=None):
+    '''Run bootstrap analysis and summarise per pair
+    With profiler, the replicates and their summary are timed as the
+    bootstrap_similarities and summary stages.
+    '''
 
-    ys = {}
+    profiler = profiler or StageProfiler(enabled=False)
     num_surgs = df['surgeon'].nunique()
 
-    # Don't repeat inside nested loop
-    for i in range(num_surgs):
-        ys[i] = get_surgeon_data(df, i, feature, bandwidth=bw_median)
+    if argv.early_stop is not None:
+        with profiler.stage('bootstrap_similarities'):
+            summary = sequential_similarities(df, bw_median, xs, argv, cache=cache)
+        print('\nUsed %d of %d bootstrap samples' % (summary.count, argv.samples))
+        with profiler.stage('summary'):
+            return summary.summarise(num_surgs)[SUMMARY_COLUMNS]
 
-    sims = []
+    if argv.summary == 'streaming':
+        with profiler.stage('bootstrap_similarities'):
+            summary = stream_similarities(df, bw_median, xs, argv, cache)
+        with profiler.stage('summary'):
+            return summary.summarise(num_surgs)
+
+    with profiler.stage('bootstrap_similarities'):
+        bs_similarity = bootstrap_similarities(df, bw_median, xs, argv, cache)
+
+    with profiler.stage('summary'):
+        return summarise_similarities(bs_similarity, num_surgs)
+
+
+def get_densities(df, feature, bw_median, xs, kde_engine='scipy'):
+    '''Stack kernel density estimates for all surgeons into (U x grid) array'''
+
+    num_surgs = df['surgeon'].nunique()
+    ys = np.empty((num_surgs, len(xs)))
 
     for i in range(num_surgs):
-        for j in range(num_surgs):
-            if j > i:
-                inters = kde_intersection(xs, ys[i], ys[j])
-                sims.append([i, j, round(inters, 6)])
+        ys[i] = get_surgeon_data(df, i, feature, bandwidth=bw_median, xs=xs,
+                                 kde_engine=kde_engine)
 
-    similarity = pd.DataFrame(sims, columns=['i', 'j', 'intersection'])
+    return ys
 
-    return similarity
 
+def cached_densities(df, feature, bw_median, xs, kde_engine='scipy', cache=None):
+    '''get_densities, read from or stored in cache when there is one'''
 
-def main(argv):
-    '''main function'''
+    params = {'feature': feature, 'bw_median': float(bw_median), 'kde_engine': kde_engine}
+    entry = cache.get('densities', **params) if cache is not None else None
+
+    if entry is not None:
+        return entry['ys']
+
+    ys = get_densities(df, feature, bw_median, xs, kde_engine)
+    if cache is not None:
+        cache.put('densities', {'ys': ys}, **params)
+
+    return ys
+
+
+def get_similarities(df, feature, bw_median, xs, kde_engine='scipy'):
+    '''Calculate similarities between surgeons
+    Returns condensed array of percent overlaps for pairs i < j
+    '''
+
+    ys = get_densities(df, feature, bw_median, xs, kde_engine)
+
+    return kde_intersections(xs, ys)
+
+
+class SimilarityState:
+    '''Persistent point estimate similarities for incremental updates
+    Holds per surgeon binned counts and moments of the feature, their
+    binned kdes and the condensed percent overlap array.  New observations
+    only touch the surgeons they belong to, so only those kdes and overlap
+    rows are recomputed.  Uses the fft kde, or the circular kde for circular
+    features, with bandwidth factor bw_median fixed when the state is made.
+    bw_median is saved with the state and reused by every update, so an
+    updated state matches a fresh state given the same bw_median, not a
+    rebuild that reselects the bandwidth from all notifications.
+    '''
+
+    def __init__(self, feature, bw_median):
+        self.feature = feature
+        self.bw_median = float(bw_median)
+        self.xs = feature_grid(feature)
+        self.circular = feature in CIRCULAR_FEATURES
+        self.offset = 0
+        self.names = []
+
+        # Linear features are binned with len(xs) padding points each side
+        self.num_bins = len(self.xs) - 1 if self.circular else 3 * len(self.xs)
+        self.counts = np.zeros((0, self.num_bins))
+        # Observations and sums of (x, x^2) or (cos, sin) per surgeon
+        self.moments = np.zeros((0, 3))
+        self.ys = np.zeros((0, len(self.xs)))
+        self.overlaps = np.zeros(0)
+
+    def add(self, codes, secs, names):
+        '''Add observations, codes index into names which extends self.names
+        Returns codes of surgeons whose kdes changed.
+        '''
+
+        codes = np.asarray(codes, dtype=np.int64)
+        num_old = len(self.names)
+        num_surgs = len(names)
+        self.names = list(names)
+        self._grow(num_old, num_surgs)
+
+        values = FEATURE_TRANSFORMERS[self.feature](np.asarray(secs, dtype=float))
+
+        if self.circular:
+            self.counts += circular_binning(values, self.num_bins, codes, num_surgs)
+            sums = (np.cos(values), np.sin(values))
+        else:
+            dx = self.xs[1] - self.xs[0]
+            self.counts += linear_binning(values, self.xs[0] - len(self.xs) * dx, dx,
+                                          self.num_bins, codes, num_surgs)
+            sums = (values, values ** 2)
+
+        self.moments += np.stack([np.bincount(codes, minlength=num_surgs),
+                                  np.bincount(codes, weights=sums[0], minlength=num_surgs),
+                                  np.bincount(codes, weights=sums[1], minlength=num_surgs)],
+                                 axis=1)
+
+        changed = np.union1d(np.unique(codes), np.arange(num_old, num_surgs))
+        self._refresh(changed)
+
+        return changed
+
+    def _grow(self, num_old, num_surgs):
+        '''Make room for new surgeons, moving overlaps to the new layout'''
+
+        if num_surgs == num_old:
+            return
+
+        extra = num_surgs - num_old
+        self.counts = np.vstack([self.counts, np.zeros((extra, self.num_bins))])
+        self.moments = np.vstack([self.moments, np.zeros((extra, 3))])
+        self.ys = np.vstack([self.ys, np.zeros((extra, len(self.xs)))])
+
+        overlaps = np.zeros(num_surgs * (num_surgs - 1) // 2)
+        i, j = pair_indices(num_old)
+        overlaps[condensed_index(i, j, num_surgs)] = self.overlaps
+        self.overlaps = overlaps
+
+    def _density(self, c):
+        '''Binned kde of surgeon c, zero if there are too few observations'''
+
+        n, a, b = self.moments[c]
+        dens = np.zeros(len(self.xs))
+
+        if self.circular:
+            dx = 2 * np.pi / self.num_bins
+            h = self.bw_median * np.sqrt(-2 * np.log(min(np.hypot(a, b) / max(n, 1), 1)))
+            if n >= 2:
+                dens[:-1] = circular_smooth(self.counts[c], h) / (n * dx)
+                dens[-1] = dens[0]
+        else:
+            dx = self.xs[1] - self.xs[0]
+            h = self.bw_median * np.sqrt(max(b - a * a / max(n, 1), 0) / max(n - 1, 1))
+            if n >= 2 and h > 0:
+                pad = len(self.xs)
+                dens = fft_smooth(self.counts[c], h, dx)[pad:pad + len(self.xs)] / n
+
+        return np.maximum(dens, 0)
+
+    def _refresh(self, changed):
+        '''Recompute kdes and overlap rows of changed surgeons'''
+
+        for c in changed:
+            self.ys[c] = self._density(c)
+
+        num_surgs = len(self.names)
+        weights = trapezoid_weights(self.xs)
+        block = max(1, 2 ** 22 // max(1, num_surgs * len(self.xs)))
+
+        for start in range(0, len(changed), block):
+            rows = changed[start:start + block]
+            inters = np.minimum(self.ys[rows][:, None, :], self.ys[None, :, :]) @ weights
+
+            i = np.repeat(rows, num_surgs)
+            j = np.tile(np.arange(num_surgs), len(rows))
+            keep = i != j
+            lo, hi = np.minimum(i, j)[keep], np.maximum(i, j)[keep]
+
+            self.overlaps[condensed_index(lo, hi, num_surgs)] = \
+                np.round(inters.ravel()[keep] * 100, 6)
+
+    def top_pairs(self, k=10):
+        '''Dataframe of the k most similar pairs of surgeon names'''
+
+        import pandas as pd
+
+        order = np.argsort(-self.overlaps, kind='stable')[:k]
+        i, j = condensed_to_pairs(order, len(self.names))
+        names = np.array(self.names)
+
+        return pd.DataFrame({'i': names[i], 'j': names[j], 'intersection': self.overlaps[order]})
+
+    def save(self, filename):
+        '''Write state to npz file, replacing any previous state atomically'''
+
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, feature=self.feature, bw_median=self.bw_median, offset=self.offset,
+                     names=np.array(self.names, dtype=str), counts=self.counts,
+                     moments=self.moments, ys=self.ys, overlaps=self.overlaps)
+        os.replace(tmp, filename)
+
+    @classmethod
+    def load(cls, filename):
+        '''Read state written by save'''
+
+        with np.load(filename) as data:
+            state = cls(str(data['feature']), float(data['bw_median']))
+            state.offset = int(data['offset'])
+            state.names = data['names'].tolist()
+            state.counts = data['counts']
+            state.moments = data['moments']
+            state.ys = data['ys']
+            state.overlaps = data['overlaps']
+
+        return state
+
+
+def update_similarity_state(argv):
+    '''Create state file from CSV, or update it with rows appended since
+    Updates keep the bandwidth factor saved by the first build.
+    '''
+
+    import pandas as pd
+
+    state = None
+    if os.path.exists(argv.state):
+        state = SimilarityState.load(argv.state)
+
+        if state.feature != argv.feature:
+            raise ValueError('State file %s holds feature %s, not %s'
+                             % (argv.state, state.feature, argv.feature))
+        if os.path.getsize(argv.filename) < state.offset:
+            raise ValueError('%s is shorter than when state file %s was saved, remove it to rebuild'
+                             % (argv.filename, argv.state))
+
+    lookup = {name: code for code, name in enumerate(state.names)} if state else {}
+    offset = state.offset if state else 0
+    codes = [np.empty(0, dtype=np.int32)]
+    secs = [np.empty(0, dtype=np.int32)]
+
+    for chunk_codes, chunk_secs, offset in iter_notifications(argv.filename, lookup, offset=offset):
+        codes.append(chunk_codes)
+        secs.append(chunk_secs)
+
+    codes = np.concatenate(codes)
+    secs = np.concatenate(secs)
+
+    if state is None:
+        # Bandwidth is selected from the first batch of notifications only,
+        # later updates reuse it so unchanged surgeons keep their kdes
+        df = pd.DataFrame({'surgeon': pd.Categorical.from_codes(codes, list(lookup)),
+                           'secs': secs})
+        df[argv.feature] = FEATURE_TRANSFORMERS[argv.feature](df['secs'])
+        bw_median = kde_bandwidth(df, argv.feature, argv.bw_method, verbose=argv.verbose)
+        state = SimilarityState(argv.feature, bw_median)
+
+    changed = state.add(codes, secs, list(lookup))
+    state.offset = offset
+    state.save(argv.state)
+
+    if argv.verbose:
+        print('\nRead %d new notifications, updated %d of %d surgeons'
+              % (len(secs), len(changed), len(state.names)))
+
+    return state
+
+
+def file_digest(filename, block=2 ** 20):
+    '''Hex blake2b digest of file contents'''
+
+    digest = hashlib.blake2b(digest_size=16)
+
+    with open(filename, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(block), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class ResultCache:
+    '''On-disk cache of bandwidths, kdes and bootstrap replicates for one input
+    Each entry is an npz file in directory named by a hash of the input
+    digest, the entry kind and its parameters.  Reading an entry touches
+    its mtime and writing one evicts least recently used entries until
+    the directory holds at most max_mb megabytes of entries.
+    '''
+
+    def __init__(self, directory, digest, max_mb=512, **params):
+        self.directory = directory
+        self.digest = digest
+        self.max_bytes = max_mb * 2 ** 20
+        self.params = params
+        os.makedirs(directory, exist_ok=True)
+
+    def scoped(self, **params):
+        '''Cache whose keys also include params'''
+
+        return ResultCache(self.directory, self.digest, self.max_bytes / 2 ** 20,
+                           **self.params, **params)
+
+    def _path(self, kind, params):
+        '''Entry file for kind and params'''
 
-    df = pd.read_csv(argv.filename,
-                     header=None,
-                     names=['surgeon', 'notification_time'],
-                     dtype={'surgeon': 'str', 'notification_time': 'str'})
+        key = repr((self.digest, kind, sorted({**self.params, **params}.items())))
+        name = kind + '-' + hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + '.npz'
 
-    df['ds'] = pd.to_datetime(df['notification_time'], format='%H:%M:%S')
-    df['secs'] = (df['ds'] - df['ds'].dt.normalize()).dt.total_seconds().astype(int)
+        return os.path.join(self.directory, name)
+
+    def get(self, kind, **params):
+        '''Dict of arrays stored for kind and params, None if not cached'''
+
+        path = self._path(kind, params)
+
+        try:
+            with np.load(path) as data:
+                arrays = dict(data)
+        except (OSError, ValueError):
+            return None
+
+        os.utime(path)
+
+        return arrays
+
+    def put(self, kind, arrays, **params):
+        '''Store dict of arrays for kind and params, replacing any previous entry'''
+
+        path = self._path(kind, params)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh, **arrays)
+        os.replace(tmp, path)
+
+        self.evict()
+
+    def evict(self):
+        '''Remove least recently used entries until under max_bytes'''
+
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+class StageProfiler:
+    '''Per-stage wall time and, optionally, peak memory
+    Tracing memory with tracemalloc slows every allocation, about 2x for the
+    bootstrap, so it is off unless trace_memory is set and traced seconds
+    should not be compared with untraced ones.  Peak memory is traced in
+    this process only, work done in bootstrap worker processes is not
+    measured.
+    '''
+
+    def __init__(self, enabled=True, trace_memory=False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        '''Time, and trace if trace_memory, the body of a with statement'''
+
+        if not self.enabled:
+            yield
+            return
+
+        if self.trace_memory:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = np.nan
+            if self.trace_memory:
+                peak = (tracemalloc.get_traced_memory()[1] - base) / 2 ** 20
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append({'stage': name, 'seconds': elapsed, 'peak_mb': peak})
+
+    def report(self):
+        '''Print per-stage breakdown'''
+
+        import pandas as pd
+
+        df_stages = pd.DataFrame(self.stages, columns=['stage', 'seconds', 'peak_mb'])
+        df_stages['percent'] = 100 * df_stages['seconds'] / df_stages['seconds'].sum()
+        if not self.trace_memory:
+            df_stages = df_stages.drop(columns='peak_mb')
+        print('\nProfile:\n', df_stages.round(4).to_string(index=False))
+
+
+def load_notifications(filename, reader='pandas'):
+    '''Read notification CSV and add seconds of day derived features'''
+
+    import pandas as pd
+
+    if reader == 'chunked':
+        df = read_notifications(filename)
+    else:
+        df = pd.read_csv(filename,
+                         header=None,
+                         names=['surgeon', 'notification_time'],
+                         dtype={'surgeon': 'str', 'notification_time': 'str'})
+
+        df['ds'] = pd.to_datetime(df['notification_time'], format='%H:%M:%S')
+        df['secs'] = (df['ds'] - df['ds'].dt.normalize()).dt.total_seconds().astype(int)
 
     df['secs.sin'] = sin_transformer(df['secs'])
     df['secs.cos'] = cos_transformer(df['secs'])
+    df['secs.circ'] = circular_transformer(df['secs'])
+
+    return df
+
+
+def main(argv):
+    '''main function'''
+
+    import pandas as pd
+
+    profiler = StageProfiler(argv.profile, argv.profile_memory)
+
+    if argv.update:
+        with profiler.stage('update'):
+            state = update_similarity_state(argv)
+        top = state.top_pairs()
+        print('\nPercent overlap between users i and j:\n', top)
+        print("\nThe two most similar surgeons are: %s and %s\n" % (top['i'][0], top['j'][0]))
+        if argv.profile:
+            profiler.report()
+        return
+
+    cache = None
+    if argv.cache is not None:
+        cache = ResultCache(argv.cache, file_digest(argv.filename), argv.cache_mb)
+
+    with profiler.stage('read_csv'):
+        df = load_notifications(argv.filename, argv.reader)
 
     if argv.verbose:
         print_df_summary(df)
@@ -236,25 +1680,45 @@ def main(argv):
     if argv.verbose:
         print(df_gb)
 
-    bw_medians = {}
-    for feat in ['secs', 'secs.sin', 'secs.cos']:
-        bw_medians[feat, argv.bw_method] = kde_bandwidth(df, feat, argv.bw_method, verbose=argv.verbose)
+    # Only the feature and bandwidth method in use are ever computed
+    with profiler.stage('kde_bandwidth'):
+        entry = cache.get('bandwidth', feature=argv.feature, bw_method=argv.bw_method) \
+            if cache is not None else None
+        if entry is not None:
+            bw_median = float(entry['bw_median'])
+        else:
+            bw_median = kde_bandwidth(df, argv.feature, argv.bw_method, verbose=argv.verbose)
+            if cache is not None:
+                cache.put('bandwidth', {'bw_median': bw_median},
+                          feature=argv.feature, bw_method=argv.bw_method)
 
-    if argv.verbose:
-        print('\nbw_medians = ')
-        pp.pprint(bw_medians)
-
-    bw_median = bw_medians[argv.feature, argv.bw_method]
     if argv.verbose:
         print(f'{bw_median = }')
-    xs = get_xs(-2, 2, 200)
+    xs = feature_grid(argv.feature)
+
+    # Same stages as tech_test_q1_bench, the point estimate kdes and overlaps
+    # are timed on their own ahead of the bootstrap
+    if argv.top_k is not None:
+        bs_sims_sum = top_k_similarities(df, bw_median, xs, argv, cache, profiler)
+    else:
+        with profiler.stage('get_surgeon_data'):
+            ys = cached_densities(df, argv.feature, bw_median, xs, argv.kde_engine, cache)
 
-    bs_similarity = bootstrap_similarities(df, bw_median, xs, argv)
-    bs_sims_sum = summarise_similarities(bs_similarity, 'intersection')
+        with profiler.stage('kde_intersections'):
+            inters = kde_intersections(xs, ys)
+
+        if argv.verbose:
+            i, j = condensed_to_pairs([np.argmax(inters)], len(ys))
+            print('\nMost similar on point estimate: user%d and user%d' % (i[0], j[0]))
+
+        bs_sims_sum = bootstrap_summary(df, bw_median, xs, argv, cache, profiler)
     print('\nPercent overlap between users i and j:\n', bs_sims_sum)
 
     print("\nThe two most similar surgeons are: user%d and user%d\n" % (bs_sims_sum.index[0]))
 
+    if argv.profile:
+        profiler.report()
+
 
 def int_range(imin=None, imax=None):
     '''Check argparse integer range'''
@@ -273,6 +1737,23 @@ def int_range(imin=None, imax=None):
     return check_range
 
 
+def float_range(fmin=None, fmax=None):
+    '''Check argparse float range'''
+
+    def check_range(x):
+        x = float(x)
+
+        if fmin is not None and x < fmin:
+            raise argparse.ArgumentTypeError("%r not in range [%r, %r]" % (x, fmin, fmax))
+
+        if fmax is not None and x > fmax:
+            raise argparse.ArgumentTypeError("%r not in range [%r, %r]" % (x, fmin, fmax))
+
+        return x
+
+    return check_range
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Find two most similar users from CSV file')
 
@@ -285,6 +1766,10 @@ if __name__ == "__main__":
     opts.add_argument('-v',  '--verbose',
                       help='Print additional information - default=%(default)s',
                       default=False, action="store_true")
+    opts.add_argument('-rd', '--reader',
+                      help='CSV reader, chunked streams bytes to int32 seconds - default=%(default)s',
+                      default='pandas', type=str,
+                      choices=['pandas', 'chunked'])
     opts.add_argument('-bs', '--samples',
                       help='Bootstrap samples - default=%(default)s',
                       default=5000, type=int_range(10, 100000),
@@ -292,12 +1777,70 @@ if __name__ == "__main__":
     opts.add_argument('-ft', '--feature',
                       help='Feature name - default=%(default)s',
                       default='secs.cos', type=str,
-                      choices=['secs', 'secs.sin', 'secs.cos'])
+                      choices=['secs', 'secs.sin', 'secs.cos', 'secs.circ'])
     opts.add_argument('-bw', '--bw_method',
                       help='Bandwidth method - default=%(default)s',
                       default='bw_scott', type=str,
-                      choices=['bw_scott', 'bw_silverman', 'scott', 'silverman', 'cv_ls'])
+                      choices=['bw_scott', 'bw_silverman', 'scott', 'silverman', 'cv_ls',
+                               'cv_ls_binned'])
+    opts.add_argument('-ke', '--kde_engine',
+                      help='KDE engine, fft bins onto grid - default=%(default)s',
+                      default='scipy', type=str,
+                      choices=['scipy', 'fft'])
+    opts.add_argument('-be', '--bootstrap_engine',
+                      help='Bootstrap engine, arrays resamples grouped index arrays - default=%(default)s',
+                      default='pandas', type=str,
+                      choices=['pandas', 'arrays'])
+    opts.add_argument('-sm', '--summary',
+                      help='Bootstrap summary, streaming keeps O(pairs) memory - default=%(default)s',
+                      default='exact', type=str,
+                      choices=['exact', 'streaming'])
+    opts.add_argument('-tk', '--top_k',
+                      help='Only bootstrap the top k pairs on the point estimate - default=%(default)s',
+                      default=None, type=int_range(1, 100000),
+                      metavar="[1, 100000]")
+    opts.add_argument('-es', '--early_stop',
+                      help='Stop bootstrap once top pair is separated at this confidence - default=%(default)s',
+                      default=None, type=float_range(0.5, 0.999),
+                      metavar="[0.5, 0.999]")
+    opts.add_argument('-s',  '--seed',
+                      help='Root seed, each bootstrap sample gets an independent stream - default=%(default)s',
+                      default=42, type=int)
+    opts.add_argument('-w',  '--workers',
+                      help='Bootstrap worker processes - default=%(default)s',
+                      default=multiprocessing.cpu_count(), type=int_range(1, 1024),
+                      metavar="[1, 1024]")
+    opts.add_argument('-cs', '--chunk_size',
+                      help='Bootstrap samples per worker task, automatic if omitted - default=%(default)s',
+                      default=None, type=int_range(1, 100000),
+                      metavar="[1, 100000]")
+
+    opts.add_argument('-pr', '--profile',
+                      help='Print per-stage time - default=%(default)s',
+                      default=False, action="store_true")
+    opts.add_argument('-pm', '--profile_memory',
+                      help='Profile and also trace per-stage peak memory, slows every stage - default=%(default)s',
+                      default=False, action="store_true")
+    opts.add_argument('-ca', '--cache',
+                      help='Directory caching bandwidths, kdes and bootstrap samples - default=%(default)s',
+                      default=None, type=str)
+    opts.add_argument('-cm', '--cache_mb',
+                      help='Cache size limit in MB, least recently used evicted - default=%(default)s',
+                      default=512, type=int_range(1, 1000000),
+                      metavar="[1, 1000000]")
+    opts.add_argument('-st', '--state',
+                      help='State file for incremental updates - default=%(default)s',
+                      default=None, type=str)
+    opts.add_argument('-up', '--update',
+                      help='Create or update --state from new CSV rows, no bootstrap, '
+                           'bandwidth stays as first selected - default=%(default)s',
+                      default=False, action="store_true")
 
     args = parser.parse_args()
 
+    if args.update and args.state is None:
+        parser.error("-up/--update requires -st/--state")
+
+    args.profile = args.profile or args.profile_memory
+
     main(args)
@@ -0,0 +1,204 @@
+'''Benchmark the tech_test_q1 surgeon similarity pipeline on synthetic data'''
+
+import os
+import json
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import scipy
+
+import tech_test_q1 as tt
+
+
+def generate_notifications(filename, num_surgs, num_obs, clusters=2, spread=1800, seed=0):
+    '''Write synthetic surgeon,HH:MM:SS CSV
+    Each surgeon receives num_obs notifications around clusters times of
+    day drawn at random, normally distributed with spread seconds standard
+    deviation.  spread=0 gives notifications uniform over the day.
+    '''
+
+    rng = np.random.default_rng(seed)
+    surgeons = np.repeat(np.arange(num_surgs), num_obs)
+
+    if spread > 0:
+        centres = rng.uniform(0, 24 * 3600, (num_surgs, clusters))
+        picks = rng.integers(0, clusters, len(surgeons))
+        secs = rng.normal(centres[surgeons, picks], spread)
+    else:
+        secs = rng.uniform(0, 24 * 3600, len(surgeons))
+
+    secs = np.mod(secs, 24 * 3600).astype(int)
+    order = rng.permutation(len(surgeons))
+
+    df = pd.DataFrame({'surgeon': np.char.add('user', surgeons[order].astype(str)),
+                       'time': ['%02d:%02d:%02d' % (s // 3600, s % 3600 // 60, s % 60)
+                                for s in secs[order]]})
+    df.to_csv(filename, header=False, index=False)
+
+
+def git_version():
+    '''Current git commit of this script, None outside a repository'''
+
+    try:
+        out = subprocess.run(['git', 'describe', '--always', '--dirty'],
+                             cwd=os.path.dirname(os.path.abspath(__file__)),
+                             capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return out.stdout.strip()
+
+
+def run_benchmark(filename, argv, trace_memory=False):
+    '''Time each pipeline stage on filename, return list of stage results
+    With trace_memory, peak memory is traced and the seconds are inflated.
+    '''
+
+    profiler = tt.StageProfiler(trace_memory=trace_memory)
+
+    with profiler.stage('read_csv'):
+        tt.load_notifications(filename, 'pandas')
+
+    with profiler.stage('read_chunked'):
+        df = tt.load_notifications(filename, 'chunked')
+
+    with profiler.stage('kde_bandwidth'):
+        bw_median = tt.kde_bandwidth(df, argv.feature, argv.bw_method)
+
+    xs = tt.feature_grid(argv.feature)
+
+    with profiler.stage('get_surgeon_data'):
+        values, offsets = tt.group_observations(df, argv.feature)
+        ys = tt.get_densities_arrays(values, offsets, argv.feature, bw_median, xs,
+                                     argv.kde_engine)
+
+    with profiler.stage('kde_intersections'):
+        tt.kde_intersections(xs, ys)
+
+    # Times the bootstrap_similarities and summary stages
+    tt.bootstrap_summary(df, bw_median, xs, argv, profiler=profiler)
+
+    return profiler.stages
+
+
+def main(argv):
+    '''Run benchmark over every scale, print and save results'''
+
+    meta = {'version': git_version(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scipy': scipy.__version__,
+            'seed': argv.seed,
+            'feature': argv.feature,
+            'bw_method': argv.bw_method,
+            'kde_engine': argv.kde_engine,
+            'bootstrap_engine': argv.bootstrap_engine,
+            'samples': argv.samples,
+            'workers': argv.workers}
+
+    rows = []
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # Warm up on a tiny file so lazy imports and other one-off costs,
+        # some only paid on a second call, are not charged to the first scale
+        filename = os.path.join(tmpdir, 'warm_up.csv')
+        generate_notifications(filename, 4, 20, argv.clusters, argv.spread, argv.seed)
+        for _ in range(2):
+            run_benchmark(filename, argv)
+
+        for num_surgs in argv.surgeons:
+            for num_obs in argv.notifications:
+                filename = os.path.join(tmpdir, 'notifications_%d_%d.csv' % (num_surgs, num_obs))
+                generate_notifications(filename, num_surgs, num_obs, argv.clusters, argv.spread,
+                                       argv.seed)
+
+                # Seconds from an untraced pass, peak memory from a traced one
+                stages = run_benchmark(filename, argv)
+                if argv.no_memory:
+                    for stage in stages:
+                        stage['peak_mb'] = None
+                else:
+                    traced = run_benchmark(filename, argv, trace_memory=True)
+                    for stage, traced_stage in zip(stages, traced):
+                        stage['peak_mb'] = traced_stage['peak_mb']
+
+                for stage in stages:
+                    rows.append(dict(meta, surgeons=num_surgs, notifications=num_obs, **stage))
+
+    results = pd.DataFrame(rows)
+    print(results[['surgeons', 'notifications', 'stage', 'seconds', 'peak_mb']]
+          .round(4).to_string(index=False))
+
+    if argv.output is not None:
+        with open(argv.output, 'a') as fh:
+            for row in rows:
+                fh.write(json.dumps(row) + '\n')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description='Benchmark surgeon similarity pipeline on synthetic data')
+
+    opts = parser.add_argument_group('optional arguments')
+    opts.add_argument('-ns', '--surgeons',
+                      help='Numbers of surgeons - default=%(default)s',
+                      default=[8, 64], type=tt.int_range(2, 1000000), nargs='+')
+    opts.add_argument('-no', '--notifications',
+                      help='Notifications per surgeon - default=%(default)s',
+                      default=[100, 1000], type=tt.int_range(2, 1000000), nargs='+')
+    opts.add_argument('-cl', '--clusters',
+                      help='Notification time clusters per surgeon - default=%(default)s',
+                      default=2, type=tt.int_range(1, 24))
+    opts.add_argument('-sp', '--spread',
+                      help='Cluster standard deviation in seconds, 0 for uniform - default=%(default)s',
+                      default=1800, type=tt.int_range(0, 86400))
+    opts.add_argument('-nm', '--no_memory',
+                      help='Skip the tracemalloc pass measuring peak memory - default=%(default)s',
+                      default=False, action="store_true")
+    opts.add_argument('-o',  '--output',
+                      help='Append results as JSON lines to this file - default=%(default)s',
+                      default=None, type=str)
+    opts.add_argument('-bs', '--samples',
+                      help='Bootstrap samples - default=%(default)s',
+                      default=20, type=tt.int_range(10, 100000),
+                      metavar="[10, 100000]")
+    opts.add_argument('-ft', '--feature',
+                      help='Feature name - default=%(default)s',
+                      default='secs.circ', type=str,
+                      choices=['secs', 'secs.sin', 'secs.cos', 'secs.circ'])
+    opts.add_argument('-bw', '--bw_method',
+                      help='Bandwidth method - default=%(default)s',
+                      default='bw_scott', type=str,
+                      choices=['bw_scott', 'bw_silverman', 'scott', 'silverman', 'cv_ls',
+                               'cv_ls_binned'])
+    opts.add_argument('-ke', '--kde_engine',
+                      help='KDE engine - default=%(default)s',
+                      default='scipy', type=str,
+                      choices=['scipy', 'fft'])
+    opts.add_argument('-be', '--bootstrap_engine',
+                      help='Bootstrap engine - default=%(default)s',
+                      default='arrays', type=str,
+                      choices=['pandas', 'arrays'])
+    opts.add_argument('-w',  '--workers',
+                      help='Bootstrap worker processes - default=%(default)s',
+                      default=1, type=tt.int_range(1, 1024))
+    opts.add_argument('-s',  '--seed',
+                      help='Seed for data generation and bootstrap - default=%(default)s',
+                      default=0, type=int)
+
+    args = parser.parse_args()
+
+    # Settings tech_test_q1.bootstrap_summary expects but the benchmark fixes
+    args.verbose = False
+    args.chunk_size = None
+    args.summary = 'exact'
+    args.early_stop = None
+
+    main(args)
@@ -0,0 +1,132 @@
+'''Tests for polygon_inside_circle, run with python -m pytest'''
+
+import os
+import sys
+import subprocess
+
+import numpy as np
+import pytest
+
+import polygon_inside_circle as pic
+
+# print_v is defined when the script runs, tests stay quiet
+pic.print_v = lambda *args, **kwargs: None
+
+
+def regular_polygon(num_points, radius=10.0):
+    angles = 2 * np.pi * np.arange(num_points) / num_points
+    return radius * np.column_stack([np.cos(angles), np.sin(angles)])
+
+
+def random_points(num_points, seed):
+    return np.random.default_rng(seed).normal(0, 50, (num_points, 2))
+
+
+def collinear_points(num_points, seed):
+    t = np.random.default_rng(seed).uniform(-20, 30, num_points)
+    return np.column_stack([3 + 2 * t, -1 + 0.5 * t])
+
+
+def duplicate_points(num_points, seed):
+    points = np.random.default_rng(seed).integers(-5, 5, (num_points, 2)).astype(np.float64)
+    return np.concatenate([points, points[::-1], points[:3]])
+
+
+POLYGONS = {'triangle': np.array([(0, 0), (2, 0), (2, 2)], dtype=np.float64),
+            'star': np.array([(0, 100), (59, 81), (95, 31), (36, -12), (59, -81), (-59, -81),
+                              (-36, -12), (-95, 31), (-59, 81)], dtype=np.float64),
+            'regular_5': regular_polygon(5),
+            'regular_64': regular_polygon(64),
+            'random_10': random_points(10, 1),
+            'random_3000': random_points(3000, 2),
+            'collinear_3': collinear_points(3, 3),
+            'collinear_500': collinear_points(500, 4),
+            'duplicates_20': duplicate_points(20, 5),
+            'duplicates_2500': duplicate_points(2500, 6)}
+
+
+def covers(points, center, radius, rel_tol=1e-9):
+    dist = np.hypot(*(points - np.asarray(center)).T)
+    return np.all(dist <= radius * (1 + rel_tol) + rel_tol)
+
+
+@pytest.mark.parametrize('name', POLYGONS)
+def test_welzl_matches_cvxpy(name):
+    points = POLYGONS[name]
+
+    _, radius = pic.welzl_enclosing_circle(points, seed=0)
+    _, expected = pic.minimum_enclosing_circle(points)
+
+    assert radius == pytest.approx(expected, rel=1e-4)
+
+
+@pytest.mark.parametrize('name', POLYGONS)
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_welzl_covers_points(name, seed):
+    points = POLYGONS[name]
+
+    center, radius = pic.welzl_enclosing_circle(points, seed=seed)
+
+    assert covers(points, center, radius)
+
+
+def test_welzl_regular_polygon_radius():
+    center, radius = pic.welzl_enclosing_circle(regular_polygon(12, 7.5), seed=0)
+
+    assert radius == pytest.approx(7.5)
+    assert np.allclose(center, 0, atol=1e-9)
+
+
+@pytest.mark.parametrize('name', POLYGONS)
+def test_ritter_covers_points(name):
+    points = POLYGONS[name]
+
+    center, radius = pic.ritter_enclosing_circle(points)
+    _, minimum = pic.welzl_enclosing_circle(points, seed=0)
+
+    assert covers(points, center, radius)
+    assert radius >= minimum * (1 - 1e-9)
+
+
+@pytest.mark.parametrize('line, fmt', [('{"vertices": [[0, "nan"], [1, 1], [2, 0]]}', 'ndjson'),
+                                       ('{"vertices": [[0, "inf"], [1, 1], [2, 0]]}', 'ndjson'),
+                                       ('[1, 2]', 'ndjson'),
+                                       ('"vertices"', 'ndjson'),
+                                       ('{"id": 1}', 'ndjson'),
+                                       ('{"vertices": [1, 2, 3]}', 'ndjson'),
+                                       ('POLYGON ((0 0, nan 1, 2 0, 0 0))', 'wkt'),
+                                       ('POLYGON ((0 0, 1 inf, 2 0, 0 0))', 'wkt')])
+def test_parse_polygon_rejects_invalid(line, fmt):
+    with pytest.raises(ValueError, match='^line 7: '):
+        pic.parse_polygon(line, fmt, line_num=7)
+
+
+def test_parse_polygon_ids():
+    poly_id, vertices = pic.parse_polygon('{"id": "a", "vertices": [[0, 0], [1, 1]]}', 'ndjson', 3)
+    assert poly_id == 'a' and vertices.shape == (2, 2)
+
+    poly_id, vertices = pic.parse_polygon('POLYGON ((0 0, 2 0, 2 2, 0 0))', 'wkt', 4)
+    assert poly_id == 4 and vertices.shape == (4, 2)
+
+
+# Far apart vertices the default solver reports infeasible
+UNSOLVABLE = [[1e9, 1e9], [1e9, -1e9], [0, 0]]
+
+
+def test_minimum_enclosing_circle_raises_on_solver_failure():
+    with pytest.raises(RuntimeError, match='status'):
+        pic.minimum_enclosing_circle(np.array(UNSOLVABLE, dtype=np.float64))
+
+
+def test_batch_reports_solver_failure(tmp_path):
+    # A solver failure in a worker once killed it and hung the parent
+    polygons = tmp_path / 'polygons.ndjson'
+    polygons.write_text('{"vertices": [[0, 0], [3, 0], [0, 4]]}\n'
+                        '{"vertices": %s}\n' % UNSOLVABLE)
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'polygon_inside_circle.py')
+    proc = subprocess.run([sys.executable, script, '-in', str(polygons), '-so', 'cvxpy', '-w', '2'],
+                          capture_output=True, text=True, timeout=120)
+
+    assert 'Invalid polygon' in proc.stdout
+    assert 'line 2: Solver failed to find a solution, status' in proc.stdout
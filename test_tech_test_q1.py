@@ -0,0 +1,114 @@
+'''Tests for tech_test_q1, run with python -m pytest'''
+
+import argparse
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import gaussian_kde
+
+import tech_test_q1 as tt
+
+
+@pytest.fixture
+def cos_data():
+    '''secs.cos of notifications clustered at two times of day'''
+
+    rng = np.random.default_rng(0)
+    secs = np.concatenate([rng.normal(9 * 3600, 1800, 150), rng.normal(15 * 3600, 3600, 100)])
+
+    return tt.cos_transformer(np.mod(secs, 24 * 3600))
+
+
+# Binning error grows as the kernel narrows towards the grid spacing,
+# about 0.7, 2 and 7 grid points here
+@pytest.mark.parametrize('bandwidth, rel_tol', [(0.1, 0.05), (0.3, 0.01), (1.0, 0.002)])
+def test_kde_fft_matches_gaussian_kde(cos_data, bandwidth, rel_tol):
+    xs = tt.feature_grid('secs.cos')
+
+    expected = gaussian_kde(cos_data, bw_method=bandwidth)(xs)
+    actual = tt.kde_fft(cos_data, bandwidth, xs)
+
+    assert np.max(np.abs(actual - expected)) <= rel_tol * expected.max()
+
+
+@pytest.mark.parametrize('bandwidth', [0.005, 0.01, 0.03, 0.1, 0.3])
+def test_kde_fft_unit_mass(cos_data, bandwidth):
+    # Bandwidths below the grid spacing are reached by cv_ls on real data
+    xs = tt.feature_grid('secs.cos')
+
+    mass = tt.kde_fft(cos_data, bandwidth, xs) @ tt.trapezoid_weights(xs)
+
+    assert mass == pytest.approx(1, abs=0.01)
+
+
+@pytest.mark.parametrize('num_surgs, k', [(2, 1), (3, 5), (60, 10), (400, 50)])
+def test_top_k_pairs_matches_all_pairs(num_surgs, k):
+    rng = np.random.default_rng(num_surgs)
+    xs = tt.feature_grid('secs.cos')
+    ys = np.stack([tt.kde_fft(rng.normal(rng.uniform(-1, 1), rng.uniform(0.05, 0.5), 50), 0.5, xs)
+                   for _ in range(num_surgs)])
+
+    i, j, overlaps = tt.top_k_pairs(xs, ys, k)
+    inters = tt.kde_intersections(xs, ys)
+
+    assert np.allclose(overlaps, np.sort(inters)[::-1][:k])
+    assert np.allclose(inters[tt.condensed_index(i, j, num_surgs)], overlaps)
+
+
+def circular_frame(shift):
+    '''Two surgeons' notification angles on the 24h clock, rotated by shift'''
+
+    rng = np.random.default_rng(1)
+    secs = {'user0': rng.normal(12 * 3600, 2400, 120), 'user1': rng.normal(13 * 3600, 3600, 80)}
+
+    return pd.DataFrame({'surgeon': np.repeat(list(secs), [len(s) for s in secs.values()]),
+                         'secs.circ': np.mod(np.concatenate(list(secs.values())) / 86400
+                                             * 2 * np.pi + shift, 2 * np.pi)})
+
+
+@pytest.mark.parametrize('bw_method', ['bw_scott', 'bw_silverman', 'cv_ls_binned'])
+def test_circular_bandwidth_and_overlap_rotation_invariant(bw_method):
+    xs = tt.feature_grid('secs.circ')
+    results = []
+
+    # Rotations by whole grid steps, noon centred data moved round to midnight
+    for steps in [0, 37, 100]:
+        df = circular_frame(steps * (xs[1] - xs[0]))
+        bandwidth = tt.kde_bandwidth(df, 'secs.circ', bw_method)
+        ys = [tt.kde_circular(df.loc[df['surgeon'] == s, 'secs.circ'], bandwidth, xs)
+              for s in ['user0', 'user1']]
+        results.append((bandwidth, tt.kde_intersections(xs, np.stack(ys))[0]))
+
+    for bandwidth, overlap in results[1:]:
+        assert bandwidth == pytest.approx(results[0][0], rel=1e-6)
+        assert overlap == pytest.approx(results[0][1], rel=1e-6)
+
+
+@pytest.mark.parametrize('feature', ['secs.cos', 'secs.circ'])
+def test_similarity_state_update_matches_fresh_state(tmp_path, feature):
+    rng = np.random.default_rng(2)
+    lines = ['user%d,%02d:%02d:%02d\n' % (rng.integers(0, 8), rng.integers(6, 20),
+                                          rng.integers(0, 60), rng.integers(0, 60))
+             for _ in range(400)]
+    # Later rows bring a new surgeon and shift another's times
+    lines += ['user%d,%02d:00:00\n' % (rng.choice([3, 9]), rng.integers(0, 24)) for _ in range(100)]
+
+    csv = tmp_path / 'notifications.csv'
+    argv = argparse.Namespace(filename=str(csv), state=str(tmp_path / 'state.npz'),
+                              feature=feature, bw_method='bw_scott', verbose=False)
+
+    csv.write_text(''.join(lines[:300]))
+    tt.update_similarity_state(argv)
+    csv.write_text(''.join(lines))
+    state = tt.update_similarity_state(argv)
+
+    # Updates reuse the first build's bandwidth, rebuild with it in one pass
+    lookup = {}
+    codes, secs = tt.parse_notifications(''.join(lines).encode(), lookup)
+    fresh = tt.SimilarityState(feature, state.bw_median)
+    fresh.add(codes, secs, list(lookup))
+
+    assert state.names == fresh.names
+    assert np.allclose(state.ys, fresh.ys)
+    assert np.allclose(state.overlaps, fresh.overlaps, atol=1e-6)